@@ -0,0 +1,293 @@
+# app/batcher.py
+"""
+Dynamic micro-batching in front of translate_ids_batch.
+
+Callers submit texts, which are split into sentence segments and tokenized
+on the caller's thread (translate/translate_many hand this to a worker
+thread, never the event loop); a background thread collects segments for
+up to BATCH_MAX_WAIT_MS (or until BATCH_MAX_SIZE are waiting), runs one padded
+generate call per generation profile and hands each decoded output back to
+the caller's future. Rows for different target languages go to separate
+generate calls.
+Segments that need no translation (see plan_segments) and segments found
+in the optional translation cache never reach the queue.
+With a ContinuousBatcher attached, greedy ("fast") segments are decoded
+there at token granularity instead of through `generate`.
+
+Background work (see app.jobs) is queued at PRIORITY_BACKGROUND: it only
+fills batch slots that interactive requests leave free and may use at most
+half of the queue, so it never pushes interactive requests into a 503.
+"""
+import asyncio
+import itertools
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.executor import InferenceBusy
+from app.cache import TieredCache, translation_cache_key
+from app.continuous import CONTINUOUS_PROFILE, ContinuousBatcher
+from app.model import (
+    DEFAULT_PROFILE,
+    DEFAULT_SOURCE_LANG,
+    GENERATION_PROFILES,
+    LANG_MAP,
+    TARGET_LANG,
+    encode_text,
+    generation_settings,
+    plan_segments,
+    translate_ids_batch,
+)
+from app.segment import join_sentences
+
+# config (override through the environment)
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "256"))
+
+# queue priorities, lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+_PRIORITY_STOP = 2
+
+_STOP = object()
+
+
+class _Item:
+    __slots__ = ("input_ids", "profile", "target_lang", "cache_key", "future")
+
+    def __init__(self, input_ids: List[int], profile: str, target_lang: str, cache_key: Optional[str] = None):
+        self.input_ids = input_ids
+        self.profile = profile
+        self.target_lang = target_lang
+        self.cache_key = cache_key
+        self.future: Future = Future()
+
+
+def _segment_items(items: Sequence[Tuple[str, Optional[str], str]]):
+    """
+    plan_segments for (text, source_lang, target_lang) items, as
+    (rows, owners, splits): one (segment, source_lang, target_lang) row and
+    one (item index, segment index) owner per segment that needs the model,
+    and (translations so far, separators) of every item.
+    """
+    rows = []
+    owners = []
+    splits = []
+    for n, (text, source_lang, target_lang) in enumerate(items):
+        segments, separators, source_lang, (fixed,) = plan_segments(text, source_lang, [target_lang])
+        splits.append((fixed, separators))
+        for i, segment in enumerate(segments):
+            if fixed[i] is None:
+                rows.append((segment, source_lang, target_lang))
+                owners.append((n, i))
+    return rows, owners, splits
+
+
+class TranslationBatcher:
+    def __init__(
+        self,
+        bundle: Dict[str, Any],
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_queue: int = BATCH_MAX_QUEUE,
+        cache: Optional[TieredCache] = None,
+        continuous: Optional[ContinuousBatcher] = None,
+    ):
+        self.bundle = bundle
+        self.cache = cache
+        self.continuous = continuous
+        self._settings = {name: generation_settings(bundle, name) for name in GENERATION_PROFILES}
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        # (priority, sequence, item): FIFO within a priority
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue(maxsize=max(1, max_queue))
+        self._sequence = itertools.count()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="translation-batcher", daemon=True)
+        self._thread.start()
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def submit(
+        self,
+        text: str,
+        source_lang: Optional[str],
+        profile: str = DEFAULT_PROFILE,
+        target_lang: str = TARGET_LANG,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> Future:
+        """
+        Queue one sentence segment that needs the model (see plan_segments)
+        for translation into `target_lang` (an NLLB code); returns a Future
+        with the result. Raises InferenceBusy when the queue is full (for
+        background work: half full). Blocking: may read the cache's disk
+        tier and tokenizes, so don't call it on the event loop.
+        """
+        src = LANG_MAP.get(source_lang, DEFAULT_SOURCE_LANG)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = translation_cache_key(text, src, target_lang, self._settings[profile])
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                future: Future = Future()
+                future.set_result(cached)
+                return future
+
+        # Tokenize on the submitting thread, so the batcher thread only generates
+        input_ids = encode_text(self.bundle, text, source_lang)
+        if (
+            self.continuous is not None
+            and profile == CONTINUOUS_PROFILE
+            and target_lang == self.continuous.target_lang
+            and priority == PRIORITY_INTERACTIVE
+        ):
+            future = self.continuous.submit(input_ids)
+            if self.cache is not None and cache_key is not None:
+                future.add_done_callback(lambda f: self._cache_result(cache_key, f))
+            return future
+
+        if priority != PRIORITY_INTERACTIVE and self._queue.qsize() >= self._queue.maxsize // 2:
+            raise InferenceBusy()
+        item = _Item(input_ids, profile, target_lang, cache_key)
+        try:
+            self._queue.put_nowait((priority, next(self._sequence), item))
+        except queue.Full:
+            raise InferenceBusy()
+        return item.future
+
+    def submit_many(
+        self,
+        texts: List[str],
+        source_lang: Optional[str],
+        profile: str = DEFAULT_PROFILE,
+        target_lang: str = TARGET_LANG,
+    ) -> List[Future]:
+        """
+        Queue several segments (see submit) at once. Either all are queued or none are:
+        on InferenceBusy the already-queued ones are cancelled.
+        """
+        return self._submit_rows([(text, source_lang, target_lang) for text in texts], profile)
+
+    def _submit_rows(
+        self, rows: Sequence[Tuple[str, Optional[str], str]], profile: str, priority: int = PRIORITY_INTERACTIVE
+    ) -> List[Future]:
+        """submit_many for (text, source_lang, target_lang) rows."""
+        futures: List[Future] = []
+        try:
+            for text, source_lang, target_lang in rows:
+                futures.append(self.submit(text, source_lang, profile, target_lang, priority))
+        except InferenceBusy:
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    async def translate(
+        self, text: str, source_lang: Optional[str], profile: str = DEFAULT_PROFILE, target_lang: str = TARGET_LANG
+    ) -> str:
+        """
+        Await the translation of a text of any length without blocking the
+        event loop. A missing source_lang is detected from the whole text.
+        """
+        return (await self.translate_many([(text, source_lang, target_lang)], profile))[0]
+
+    async def translate_many(
+        self,
+        items: Sequence[Tuple[str, Optional[str], str]],
+        profile: str = DEFAULT_PROFILE,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> List[str]:
+        """
+        Translate (text, source_lang, target_lang) items; results keep their
+        order. The segments of all items are queued together, shortest first,
+        so that consecutive batches pad to similar lengths. More segments than
+        fit in the queue are queued window by window.
+        """
+        rows, owners, splits = await asyncio.to_thread(_segment_items, items)
+        order = sorted(range(len(rows)), key=lambda r: len(rows[r][0]))
+        outputs = [""] * len(rows)
+        window = max(self.max_batch_size, self._queue.maxsize // 2)
+        for start in range(0, len(order), window):
+            idx = order[start:start + window]
+            futures = await asyncio.to_thread(self._submit_rows, [rows[r] for r in idx], profile, priority)
+            for r, out in zip(idx, await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))):
+                outputs[r] = out
+
+        for (n, i), out in zip(owners, outputs):
+            splits[n][0][i] = out
+        return [join_sentences(translations, separators) if translations else "" for translations, separators in splits]
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self._queue.put((_PRIORITY_STOP, next(self._sequence), _STOP))
+        self._thread.join(timeout)
+        if self.continuous is not None:
+            self.continuous.close(timeout)
+
+    def _cache_result(self, cache_key: str, future: Future) -> None:
+        # runs on the continuous batcher's thread; set() doesn't wait for disk
+        if not future.cancelled() and future.exception() is None:
+            self.cache.set(cache_key, future.result())
+
+    # --------------------------------------------------
+    # Worker
+    # --------------------------------------------------
+    def _collect(self, first: _Item) -> List[_Item]:
+        """Gather items until the wait window closes or the batch is full."""
+        items = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                _, _, item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # finish this batch, then stop
+                self._stopping = True
+                break
+            items.append(item)
+        return items
+
+    def _run(self) -> None:
+        while not self._stopping:
+            _, _, first = self._queue.get()
+            if first is _STOP:
+                return
+            items = self._collect(first)
+
+            # Source-language tags are per row, but each generation profile
+            # and target language needs its own generate call
+            groups: Dict[Tuple[str, str], List[_Item]] = {}
+            for item in items:
+                groups.setdefault((item.profile, item.target_lang), []).append(item)
+            for (profile, target_lang), group in groups.items():
+                self._run_batch(profile, target_lang, group)
+
+    def _run_batch(self, profile: str, target_lang: str, items: List[_Item]) -> None:
+        items = [item for item in items if item.future.set_running_or_notify_cancel()]
+        if not items:
+            return
+        try:
+            outputs = translate_ids_batch(
+                self.bundle, [item.input_ids for item in items], profile, target_lang=target_lang
+            )
+        except Exception as e:
+            traceback.print_exc()
+            for item in items:
+                item.future.set_exception(e)
+            return
+        # callers first; the disk write is queued for the cache's writer thread
+        for item, output in zip(items, outputs):
+            item.future.set_result(output)
+        if self.cache is not None:
+            self.cache.set_many(
+                (item.cache_key, output) for item, output in zip(items, outputs) if item.cache_key is not None
+            )
@@ -0,0 +1,132 @@
+# app/bench.py
+"""
+Small benchmarks for the translation model.
+
+    python -m app.bench quantize [--runs 5]
+    python -m app.bench backends [--runs 5]
+    python -m app.bench speculative --draft <model> [--runs 5]
+
+`quantize` loads the fp32 and the int8 (dynamically quantized) model and
+prints weight size and per-sentence latency side by side. `backends`
+compares the torch and ONNX Runtime backends. `speculative` compares plain
+greedy decoding with draft-model assisted decoding (outputs must match).
+"""
+import argparse
+import gc
+import io
+import statistics
+import time
+from typing import Any, Dict, List
+
+import torch
+
+from app.model import DEFAULT_PROFILE, load_model, translate_batch_with_model
+
+SAMPLE_SENTENCES = [
+    ("ne", "तिमीलाई कस्तो छ?"),
+    ("ne", "यो प्रश्न सरल देखिए पनि यो वास्तवमा धेरै जटिल अवस्थाको मुख्य भाग हो।"),
+    ("ne", "तिनीहरूले गरेका निर्णयले समाजका धेरै मानिसहरूको जीवन बदलिदिएको छ।"),
+    ("si", "ඔවුන් ගත් තීරණය සමාජයේ බොහෝ දෙනාගේ ජීවිත වෙනස් කරලා තියෙනවා."),
+    ("si", "මෙය සරළ ප්‍රශ්නයක් වගේ පේනත්, ඇත්ත වශයෙන්ම ඉතා සංකීර්ණ තත්වයක ප්‍රධාන කොටසක්."),
+]
+
+
+def model_size_mb(model) -> float:
+    """Serialized state_dict size; counts packed int8 weights too."""
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / (1024 * 1024)
+
+
+def time_translations(bundle: Dict[str, Any], runs: int, profile: str = DEFAULT_PROFILE) -> List[float]:
+    """Per-sentence latency in milliseconds (one warm-up pass excluded)."""
+    for lang, text in SAMPLE_SENTENCES[:1]:
+        translate_batch_with_model(bundle, [text], lang, profile)
+    timings = []
+    for _ in range(runs):
+        for lang, text in SAMPLE_SENTENCES:
+            start = time.perf_counter()
+            translate_batch_with_model(bundle, [text], lang, profile)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def bench_quantize(runs: int) -> None:
+    rows = []
+    for label, quantize in (("fp32", False), ("int8", True)):
+        start = time.perf_counter()
+        bundle = load_model(quantize=quantize, backend="torch")
+        load_s = time.perf_counter() - start
+        timings = time_translations(bundle, runs)
+        rows.append((label, load_s, model_size_mb(bundle["model"]), timings))
+        del bundle
+        gc.collect()
+
+    print()
+    print(f"{'variant':<8} {'load s':>8} {'weights MB':>11} {'p50 ms':>8} {'mean ms':>8}")
+    for label, load_s, size_mb, timings in rows:
+        print(f"{label:<8} {load_s:>8.1f} {size_mb:>11.1f} "
+              f"{statistics.median(timings):>8.1f} {statistics.mean(timings):>8.1f}")
+    (_, _, fp32_mb, fp32_t), (_, _, int8_mb, int8_t) = rows
+    print(f"int8 vs fp32: weights x{int8_mb / fp32_mb:.2f}, "
+          f"p50 latency x{statistics.median(int8_t) / statistics.median(fp32_t):.2f}")
+
+
+def bench_backends(runs: int) -> None:
+    rows = []
+    for backend in ("torch", "onnx"):
+        start = time.perf_counter()
+        bundle = load_model(quantize=False, backend=backend)
+        load_s = time.perf_counter() - start
+        rows.append((backend, load_s, time_translations(bundle, runs)))
+        del bundle
+        gc.collect()
+
+    print()
+    print(f"{'backend':<8} {'load s':>8} {'p50 ms':>8} {'mean ms':>8}")
+    for backend, load_s, timings in rows:
+        print(f"{backend:<8} {load_s:>8.1f} {statistics.median(timings):>8.1f} {statistics.mean(timings):>8.1f}")
+
+
+def bench_speculative(draft_name: str, runs: int) -> None:
+    from app.model import load_draft_model
+
+    bundle = load_model(quantize=False, backend="torch")
+    greedy = time_translations(bundle, runs, profile="fast")
+    plain = [translate_batch_with_model(bundle, [text], lang, "fast")[0] for lang, text in SAMPLE_SENTENCES]
+
+    bundle["draft_model"] = load_draft_model(bundle["model"], bundle["device"], draft_name)
+    if bundle["draft_model"] is None:
+        return
+    assisted = time_translations(bundle, runs, profile="fast")
+    spec = [translate_batch_with_model(bundle, [text], lang, "fast")[0] for lang, text in SAMPLE_SENTENCES]
+
+    print()
+    print(f"{'decoding':<10} {'p50 ms':>8} {'mean ms':>8}")
+    for label, timings in (("greedy", greedy), ("assisted", assisted)):
+        print(f"{label:<10} {statistics.median(timings):>8.1f} {statistics.mean(timings):>8.1f}")
+    print(f"outputs identical: {plain == spec}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    q = sub.add_parser("quantize", help="compare fp32 and int8 CPU inference")
+    q.add_argument("--runs", type=int, default=5)
+    b = sub.add_parser("backends", help="compare torch and ONNX Runtime inference")
+    b.add_argument("--runs", type=int, default=5)
+    sp = sub.add_parser("speculative", help="compare greedy and draft-assisted decoding")
+    sp.add_argument("--draft", required=True, help="seq2seq draft model sharing NLLB's vocabulary")
+    sp.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "quantize":
+        bench_quantize(args.runs)
+    elif args.command == "backends":
+        bench_backends(args.runs)
+    elif args.command == "speculative":
+        bench_speculative(args.draft, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# app/cache.py
+"""
+In-process LRU cache with an optional SQLite tier.
+
+The LRU is bounded by entry count and TTL. When a database path is given,
+entries are also written to SQLite (WAL mode), so they survive restarts
+and can be shared by every uvicorn worker on the host. Values must be
+JSON-serialisable.
+
+The LRU and the SQLite connection have separate locks, so a slow disk read
+never holds up lookups that the LRU can answer. set() / set_many() only
+update the LRU and queue the disk write: a writer thread commits queued
+entries in one transaction per drain, so callers such as the generation
+thread never wait for SQLite. A disk read (get on an LRU miss) still blocks
+the calling thread: call get from worker threads, not from the event loop.
+"""
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# config (override through the environment)
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "10000"))
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", str(7 * 24 * 3600)))
+TRANSLATION_CACHE_DB = os.getenv("TRANSLATION_CACHE_DB", "")  # empty = memory only
+CACHE_DISK_MAX_ENTRIES = int(os.getenv("CACHE_DISK_MAX_ENTRIES", "200000"))
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "1000"))
+OCR_CACHE_TTL = float(os.getenv("OCR_CACHE_TTL", str(24 * 3600)))
+OCR_CACHE_DB = os.getenv("OCR_CACHE_DB", "")  # empty = memory only
+
+_PRUNE_EVERY = 1000  # disk writes between expiry / size pruning
+_WRITE_QUEUE = 10000  # disk writes waiting for the writer thread; more are dropped
+_WRITE_BATCH = 500  # entries committed per transaction
+
+_STOP = object()
+
+
+class TieredCache:
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        ttl_seconds: float,
+        db_path: Optional[str] = None,
+        disk_max_entries: int = CACHE_DISK_MAX_ENTRIES,
+    ):
+        self.name = name
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()  # LRU and counters
+        self._db_lock = threading.Lock()  # SQLite connection
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._writes = 0
+
+        self._db = None
+        self._writer: Optional[threading.Thread] = None
+        self._pending: "queue.Queue" = queue.Queue(maxsize=_WRITE_QUEUE)
+        self._table = f"cache_{name}"
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._writer = threading.Thread(target=self._write_loop, name=f"{name}-cache-writer", daemon=True)
+            self._writer.start()
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._lru[key]
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is not None:
+                self._lru_put(key, value, now)
+                self.disk_hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, entries: Iterable[Tuple[str, Any]]) -> None:
+        """Store (key, value) pairs; their disk write is queued for the writer thread."""
+        entries = list(entries)
+        now = time.time()
+        with self._lock:
+            for key, value in entries:
+                self._lru_put(key, value, now)
+        if self._writer is None:
+            return
+        for key, value in entries:
+            try:
+                self._pending.put_nowait((key, json.dumps(value, ensure_ascii=False), now))
+            except queue.Full:
+                print(f"[WARN] {self.name} cache writer is behind; not persisting entry")
+                return
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self._table}")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "disk": self._db is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        if self._writer is not None:
+            # queued writes are flushed before the connection closes
+            self._pending.put(_STOP)
+            self._writer.join()
+            self._writer = None
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # --------------------------------------------------
+    # Internals (_lru_put with self._lock held; disk access takes self._db_lock)
+    # --------------------------------------------------
+    def _lru_put(self, key: str, value: Any, now: float) -> None:
+        self._lru[key] = (now + self.ttl, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Optional[Any]:
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return None
+                row = self._db.execute(
+                    f"SELECT value, created_at FROM {self._table} WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[WARN] {self.name} cache read failed: {e}")
+            return None
+        if row is None or row[1] + self.ttl <= now:
+            return None
+        return json.loads(row[0])
+
+    def _write_loop(self) -> None:
+        """Writer thread: commit whatever is queued in one transaction per drain."""
+        stopping = False
+        while not stopping:
+            rows = [self._pending.get()]
+            while len(rows) < _WRITE_BATCH:
+                try:
+                    rows.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in rows:
+                stopping = True
+                rows = [row for row in rows if row is not _STOP]
+            if rows:
+                self._disk_write(rows)
+
+    def _disk_write(self, rows) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                self._db.executemany(
+                    f"INSERT OR REPLACE INTO {self._table} (key, value, created_at) VALUES (?, ?, ?)", rows
+                )
+                before, self._writes = self._writes, self._writes + len(rows)
+                if before // _PRUNE_EVERY != self._writes // _PRUNE_EVERY:
+                    self._disk_prune(time.time())
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"[WARN] {self.name} cache write of {len(rows)} entries failed: {e}")
+                self._db.rollback()
+
+    def _disk_prune(self, now: float) -> None:
+        self._db.execute(f"DELETE FROM {self._table} WHERE created_at <= ?", (now - self.ttl,))
+        self._db.execute(
+            f"DELETE FROM {self._table} WHERE key IN ("
+            f"SELECT key FROM {self._table} ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,),
+        )
+
+
+def normalize_text(text: str) -> str:
+    """NFC-normalise and collapse whitespace so trivial variants share a key."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def translation_cache_key(text: str, source_lang: Optional[str], target_lang: str, settings: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        [normalize_text(text), source_lang, target_lang, settings],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def ocr_cache_key(
+    image_hash: str, source_lang: Optional[str], settings: Optional[Dict[str, Any]], kind: str = "sha256"
+) -> str:
+    """
+    Key of an OCR result: image hash (exact bytes or perceptual), the
+    requested language and a digest of the settings its translation was made
+    with (None when there is no translation model).
+    """
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"{kind}:{image_hash}:{source_lang or ''}:{digest}"
+
+
+def create_translation_cache() -> Optional[TieredCache]:
+    """Build the translation cache from the environment (None when disabled)."""
+    if TRANSLATION_CACHE_SIZE <= 0:
+        return None
+    return TieredCache(
+        "translation",
+        max_entries=TRANSLATION_CACHE_SIZE,
+        ttl_seconds=TRANSLATION_CACHE_TTL,
+        db_path=TRANSLATION_CACHE_DB or None,
+    )
+
+
+def create_ocr_cache() -> Optional[TieredCache]:
+    """Build the OCR result cache from the environment (None when disabled)."""
+    if OCR_CACHE_SIZE <= 0:
+        return None
+    return TieredCache(
+        "ocr",
+        max_entries=OCR_CACHE_SIZE,
+        ttl_seconds=OCR_CACHE_TTL,
+        db_path=OCR_CACHE_DB or None,
+    )
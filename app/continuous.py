@@ -0,0 +1,348 @@
+# app/continuous.py
+"""
+Continuous (iteration-level) batching for greedy NLLB decoding.
+
+Instead of running `model.generate` over a fixed batch, a background thread
+drives the decoder one token at a time over every active sequence. New
+requests are encoded and join at the next token boundary; finished
+sequences leave immediately, so short requests no longer wait for the
+longest sequence of someone else's batch.
+
+All active sequences share one decoder forward per token, whatever their
+length. The batch keeps one stacked KV cache between steps:
+
+- self-attention keys/values are left-padded to the longest sequence and
+  masked with a decoder attention mask;
+- cross-attention keys/values and encoder outputs are right-padded to the
+  longest source and masked with the encoder attention mask;
+- M2M100 takes decoder positions from a single cache length per forward,
+  so the decoder's sinusoidal position table is wrapped (_RowPositions)
+  to take one offset per row instead.
+
+Newly admitted requests first run one prefill forward over their start
+prefix (</s> + target language tag) and are then merged into the batch; the
+cache is only re-stacked when requests join or leave.
+
+Only greedy decoding (the "fast" profile) on the torch backend runs here;
+the batcher keeps using `generate` for everything else.
+"""
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+
+try:
+    from transformers.cache_utils import EncoderDecoderCache
+except ImportError:  # older transformers only take legacy tuples
+    EncoderDecoderCache = None
+
+from app.executor import InferenceBusy
+from app.model import TARGET_LANG, _model_lang_id, _pad_batch, decode_outputs, is_repetition_loop, max_new_tokens_for
+
+# config (override through the environment)
+CONTINUOUS_BATCHING = os.getenv("CONTINUOUS_BATCHING", "0") == "1"
+CONTINUOUS_MAX_ACTIVE = int(os.getenv("CONTINUOUS_MAX_ACTIVE", "32"))
+CONTINUOUS_MAX_QUEUE = int(os.getenv("CONTINUOUS_MAX_QUEUE", "256"))
+
+CONTINUOUS_PROFILE = "fast"
+
+_STOP = object()
+
+
+class _Sequence:
+    __slots__ = ("input_ids", "tokens", "max_length", "future")
+
+    def __init__(self, input_ids: List[int], start_tokens: List[int], max_length: int):
+        self.input_ids = input_ids
+        self.tokens = list(start_tokens)
+        self.max_length = max_length
+        self.future: Future = Future()
+
+
+class _Batch:
+    """
+    Decoder state of a set of sequences, one row each: per layer
+    (self_k, self_v, cross_k, cross_v), encoder outputs and both masks.
+    """
+
+    __slots__ = ("past", "hidden", "enc_mask", "dec_mask")
+
+    def __init__(self, past: tuple, hidden: torch.Tensor, enc_mask: torch.Tensor, dec_mask: torch.Tensor):
+        self.past = past  # self_*: (rows, heads, dec_len, dim) left-padded; cross_*: (rows, heads, src_len, dim)
+        self.hidden = hidden  # (rows, src_len, d_model), right-padded
+        self.enc_mask = enc_mask  # (rows, src_len)
+        self.dec_mask = dec_mask  # (rows, dec_len)
+
+    def merge(self, other: "_Batch") -> "_Batch":
+        dec_len = max(self.dec_mask.shape[1], other.dec_mask.shape[1])
+        src_len = max(self.enc_mask.shape[1], other.enc_mask.shape[1])
+
+        def rows(batch: "_Batch"):
+            past = tuple(
+                (
+                    _pad_dim(layer[0], 2, dec_len, left=True),
+                    _pad_dim(layer[1], 2, dec_len, left=True),
+                    _pad_dim(layer[2], 2, src_len),
+                    _pad_dim(layer[3], 2, src_len),
+                )
+                for layer in batch.past
+            )
+            return (
+                past,
+                _pad_dim(batch.hidden, 1, src_len),
+                _pad_dim(batch.enc_mask, 1, src_len),
+                _pad_dim(batch.dec_mask, 1, dec_len, left=True),
+            )
+
+        a, b = rows(self), rows(other)
+        past = tuple(
+            tuple(torch.cat([x, y], dim=0) for x, y in zip(layer_a, layer_b)) for layer_a, layer_b in zip(a[0], b[0])
+        )
+        return _Batch(past, *(torch.cat([x, y], dim=0) for x, y in zip(a[1:], b[1:])))
+
+    def select(self, keep: List[int]) -> "_Batch":
+        """Keep rows `keep` and drop padding no remaining row needs."""
+        index = torch.tensor(keep, device=self.hidden.device)
+        enc_mask = self.enc_mask.index_select(0, index)
+        dec_mask = self.dec_mask.index_select(0, index)
+        src_len = int(enc_mask.sum(dim=1).max())
+        dec_start = dec_mask.shape[1] - int(dec_mask.sum(dim=1).max())
+        past = tuple(
+            (
+                layer[0].index_select(0, index)[:, :, dec_start:],
+                layer[1].index_select(0, index)[:, :, dec_start:],
+                layer[2].index_select(0, index)[:, :, :src_len],
+                layer[3].index_select(0, index)[:, :, :src_len],
+            )
+            for layer in self.past
+        )
+        hidden = self.hidden.index_select(0, index)[:, :src_len]
+        return _Batch(past, hidden, enc_mask[:, :src_len], dec_mask[:, dec_start:])
+
+
+class _RowPositions(torch.nn.Module):
+    """
+    Wraps M2M100's sinusoidal decoder position table. While `offsets` (per
+    row: tokens already in that row's cache) is set on the calling thread,
+    each row's positions start at its own offset instead of at the cache
+    length shared by the whole forward. Other threads (generate() in the
+    batcher) get the wrapped module's behaviour unchanged.
+    """
+
+    def __init__(self, inner: torch.nn.Module):
+        super().__init__()
+        self.inner = inner
+        self._local = threading.local()
+
+    def set_offsets(self, offsets: Optional[torch.Tensor]) -> None:
+        self._local.offsets = offsets
+
+    def forward(self, input_ids=None, inputs_embeds=None, past_key_values_length=0, *args, **kwargs):
+        offsets = getattr(self._local, "offsets", None)
+        if offsets is None:
+            return self.inner(input_ids, inputs_embeds, past_key_values_length, *args, **kwargs)
+        shape = input_ids.shape if input_ids is not None else inputs_embeds.shape[:-1]
+        bsz, seq_len = shape
+        inner = self.inner
+        # same numbering as create_position_ids_from_input_ids for unpadded rows
+        position_ids = offsets[:, None] + torch.arange(seq_len, device=offsets.device) + inner.padding_idx + 1
+        max_pos = int(position_ids.max()) + 1
+        if max_pos > inner.weights.size(0):
+            inner.make_weights(max_pos + inner.offset, inner.embedding_dim, inner.padding_idx)
+        weights = inner.weights
+        return weights.index_select(0, position_ids.view(-1).to(weights.device)).view(bsz, seq_len, -1).detach()
+
+
+def _row_positions(model) -> _RowPositions:
+    """Install (once) and return the per-row position wrapper of the model's decoder."""
+    decoder = model.get_decoder()
+    positions = getattr(decoder, "embed_positions", None)
+    if isinstance(positions, _RowPositions):
+        return positions
+    if positions is None or not all(hasattr(positions, a) for a in ("weights", "make_weights", "padding_idx")):
+        raise ValueError("Continuous batching needs M2M100-style sinusoidal decoder positions")
+    decoder.embed_positions = _RowPositions(positions)
+    return decoder.embed_positions
+
+
+def _to_legacy(past) -> tuple:
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+
+def _pad_dim(t: torch.Tensor, dim: int, size: int, left: bool = False) -> torch.Tensor:
+    if t.shape[dim] == size:
+        return t
+    pad_shape = list(t.shape)
+    pad_shape[dim] = size - t.shape[dim]
+    pad = t.new_zeros(pad_shape)
+    return torch.cat([pad, t] if left else [t, pad], dim=dim)
+
+
+class ContinuousBatcher:
+    def __init__(
+        self,
+        bundle: Dict[str, Any],
+        max_active: int = CONTINUOUS_MAX_ACTIVE,
+        max_queue: int = CONTINUOUS_MAX_QUEUE,
+        target_lang: str = TARGET_LANG,
+    ):
+        self.bundle = bundle
+        self.target_lang = target_lang
+        self.max_active = max(1, max_active)
+        model = bundle["model"]
+        self._positions = _row_positions(model)
+        # models that take Cache objects get one; older ones the legacy tuples
+        self._cache_class = EncoderDecoderCache if getattr(model, "_supports_cache_class", False) else None
+        self._start_tokens = [model.config.decoder_start_token_id]
+        lang_id = _model_lang_id(bundle, target_lang)
+        if lang_id is not None:
+            self._start_tokens.append(lang_id)
+        self._eos_id = model.config.eos_token_id
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_queue))
+        # row i of self._batch belongs to self._active[i]
+        self._active: List[_Sequence] = []
+        self._batch: Optional[_Batch] = None
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="continuous-batcher", daemon=True)
+        self._thread.start()
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def submit(self, input_ids: List[int]) -> Future:
+        """
+        Queue one pre-tokenized row (see encode_text) for greedy decoding;
+        returns a Future with the decoded text. Raises InferenceBusy when full.
+        """
+        # same length budget as generate(); the start prefix doesn't count
+        max_length = len(self._start_tokens) - 1 + max_new_tokens_for([input_ids])
+        seq = _Sequence(input_ids, self._start_tokens, max_length)
+        try:
+            self._queue.put_nowait(seq)
+        except queue.Full:
+            raise InferenceBusy()
+        return seq.future
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # --------------------------------------------------
+    # Worker
+    # --------------------------------------------------
+    def _run(self) -> None:
+        while not self._stopping or self._active:
+            try:
+                self._admit(block=not self._active)
+                self._retire()
+                if not self._active:
+                    continue
+                self._step()
+                self._retire()
+            except Exception as e:
+                traceback.print_exc()
+                for seq in self._active:
+                    if not seq.future.done():
+                        seq.future.set_exception(e)
+                self._active = []
+                self._batch = None
+
+    def _forward(self, batch: _Batch, decoder_input_ids: torch.Tensor, past, dec_mask, offsets=None):
+        self._positions.set_offsets(offsets)
+        try:
+            return self.bundle["model"](
+                encoder_outputs=BaseModelOutput(last_hidden_state=batch.hidden),
+                attention_mask=batch.enc_mask,
+                decoder_input_ids=decoder_input_ids,
+                decoder_attention_mask=dec_mask,
+                past_key_values=past,
+                use_cache=True,
+                return_dict=True,
+            )
+        finally:
+            self._positions.set_offsets(None)
+
+    def _past(self, legacy: tuple):
+        return self._cache_class.from_legacy_cache(legacy) if self._cache_class is not None else legacy
+
+    @torch.inference_mode()
+    def _admit(self, block: bool) -> None:
+        """
+        Move queued requests into the batch: one encoder pass and one prefill
+        forward over the start prefix for all of them, then merge their cache.
+        """
+        new: List[_Sequence] = []
+        while len(self._active) + len(new) < self.max_active and not self._stopping:
+            try:
+                seq = self._queue.get(block=block and not new)
+            except queue.Empty:
+                break
+            if seq is _STOP:
+                self._stopping = True
+                break
+            if seq.future.set_running_or_notify_cancel():
+                new.append(seq)
+        if not new:
+            return
+
+        try:
+            inputs = _pad_batch(self.bundle, [seq.input_ids for seq in new])
+            if self.bundle.get("device") == "cuda":
+                inputs = {k: v.to("cuda") for k, v in inputs.items()}
+            hidden = self.bundle["model"].get_encoder()(**inputs, return_dict=True).last_hidden_state
+            prefix = torch.tensor([seq.tokens for seq in new], device=hidden.device)
+            dec_mask = torch.ones_like(prefix)
+            batch = _Batch((), hidden, inputs["attention_mask"], dec_mask)
+            out = self._forward(batch, prefix, None, dec_mask)
+            batch.past = _to_legacy(out.past_key_values)
+            next_tokens = out.logits[:, -1, :].argmax(dim=-1).tolist()
+        except Exception as e:
+            # not active yet, so _run's handler wouldn't see them
+            traceback.print_exc()
+            for seq in new:
+                seq.future.set_exception(e)
+            return
+        for seq, token in zip(new, next_tokens):
+            seq.tokens.append(token)
+        self._batch = batch if self._batch is None else self._batch.merge(batch)
+        self._active.extend(new)
+
+    @torch.inference_mode()
+    def _step(self) -> None:
+        """One decoder forward over every active sequence."""
+        batch = self._batch
+        device = batch.hidden.device
+        decoder_input_ids = torch.tensor([[seq.tokens[-1]] for seq in self._active], device=device)
+        # everything but the last token is in the cache
+        offsets = torch.tensor([len(seq.tokens) - 1 for seq in self._active], device=device)
+        dec_mask = torch.cat([batch.dec_mask, batch.dec_mask.new_ones((len(self._active), 1))], dim=1)
+        out = self._forward(batch, decoder_input_ids, self._past(batch.past), dec_mask, offsets)
+        batch.past = _to_legacy(out.past_key_values)
+        batch.dec_mask = dec_mask
+        for seq, token in zip(self._active, out.logits[:, -1, :].argmax(dim=-1).tolist()):
+            seq.tokens.append(token)
+
+    def _is_finished(self, seq: _Sequence) -> bool:
+        return (
+            seq.tokens[-1] == self._eos_id
+            or len(seq.tokens) >= seq.max_length
+            or is_repetition_loop(seq.tokens[len(self._start_tokens):])
+        )
+
+    def _retire(self) -> None:
+        """Resolve finished sequences and drop their rows from the batch."""
+        keep = []
+        for i, seq in enumerate(self._active):
+            if self._is_finished(seq):
+                seq.future.set_result(decode_outputs(self.bundle, torch.tensor([seq.tokens]))[0])
+            else:
+                keep.append(i)
+        if len(keep) == len(self._active):
+            return
+        self._active = [self._active[i] for i in keep]
+        self._batch = self._batch.select(keep) if keep else None
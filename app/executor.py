@@ -0,0 +1,54 @@
+# app/executor.py
+"""
+Bounded thread pool for blocking inference work (Tesseract, Whisper, ...).
+
+Async handlers await `executor.run(fn, *args)` so the event loop keeps
+serving other requests. Once INFERENCE_WORKERS jobs are running and
+INFERENCE_QUEUE_SIZE more are waiting, new submissions fail fast with
+InferenceBusy, which main.py turns into a 503 with Retry-After.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+# config (override through the environment)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "1"))
+
+
+class InferenceBusy(Exception):
+    """Raised when an inference queue is full; the caller should retry later."""
+
+    def __init__(self, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__("Inference queue is full, retry later.")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers: int = INFERENCE_WORKERS, max_queue: int = INFERENCE_QUEUE_SIZE):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        # one slot per running or waiting job
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise InferenceBusy()
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run `fn` on the pool and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,280 @@
+# app/jobs.py
+"""
+Asynchronous translation jobs for documents too long for one request.
+
+POST /jobs splits every page into sentence segments and stores them in
+SQLite; a JobWorker running in each app process claims queued jobs and
+translates them JOB_CHUNK_SEGMENTS segments at a time through the batcher
+at PRIORITY_BACKGROUND, saving each chunk as it finishes. Progress and
+partial results can be polled while the job runs.
+
+Jobs are claimed with a lease that the worker renews after every chunk. If
+a worker dies, the lease runs out and another worker (or the restarted
+one) resumes the job from its first untranslated segment.
+
+The job API is opt-in: it is only enabled when JOBS_DB names the SQLite
+file. JobStore methods block on SQLite; async code calls them through
+asyncio.to_thread.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.batcher import PRIORITY_BACKGROUND, TranslationBatcher
+from app.executor import InferenceBusy
+from app.segment import split_sentences, join_sentences
+
+# config (override through the environment)
+JOBS_DB = os.getenv("JOBS_DB", "")  # empty = job API disabled
+JOB_CHUNK_SEGMENTS = int(os.getenv("JOB_CHUNK_SEGMENTS", "16"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+
+class JobStore:
+    """SQLite (WAL) store of jobs and their segments, shared by all workers on the host."""
+
+    def __init__(self, db_path: str = JOBS_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # autocommit; claims open their own IMMEDIATE transaction
+        self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, source_lang TEXT, target_lang TEXT NOT NULL, "
+            "profile TEXT NOT NULL, pages INTEGER NOT NULL, total INTEGER NOT NULL, done INTEGER NOT NULL, "
+            "error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, lease_until REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_segments ("
+            "job_id TEXT NOT NULL, page INTEGER NOT NULL, idx INTEGER NOT NULL, "
+            "segment TEXT NOT NULL, separator TEXT NOT NULL, translation TEXT, "
+            "PRIMARY KEY (job_id, page, idx))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def create(self, pages: List[str], source_lang: Optional[str], target_lang: str, profile: str) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        rows = []
+        for page, text in enumerate(pages):
+            segments, separators = split_sentences(text)
+            # each segment keeps the separator that follows it
+            rows.extend((job_id, page, i, seg, sep) for i, (seg, sep) in enumerate(zip(segments, separators[1:])))
+        now = time.time()
+        # nothing to translate: the job is done immediately
+        status = "queued" if rows else "done"
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute(
+                    "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, 0, NULL, ?, ?, 0)",
+                    (job_id, status, source_lang, target_lang, profile, len(pages), len(rows), now, now),
+                )
+                self._db.executemany(
+                    "INSERT INTO job_segments (job_id, page, idx, segment, separator) VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, source_lang, target_lang, profile, pages, total, done, error, "
+                "created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "status", "source_lang", "target_lang", "profile", "pages", "total", "done", "error",
+                "created_at", "updated_at")
+        return dict(zip(keys, row))
+
+    def claim(self, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued job, or a running one whose lease ran out."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', lease_until = ?, updated_at = ? WHERE id = ?",
+                        (now + lease_seconds, now, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def pending(self, job_id: str, limit: int) -> List[Tuple[int, int, str]]:
+        """Up to `limit` untranslated (page, idx, segment) rows in document order."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT page, idx, segment FROM job_segments WHERE job_id = ? AND translation IS NULL "
+                "ORDER BY page, idx LIMIT ?",
+                (job_id, limit),
+            ).fetchall()
+
+    def save(
+        self, job_id: str, results: List[Tuple[int, int, str]], lease_seconds: float = JOB_LEASE_SECONDS
+    ) -> bool:
+        """
+        Store (page, idx, translation) results and renew the lease. Returns
+        False when the job is no longer running (e.g. it was cancelled).
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                running = self._db.execute(
+                    "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                    (now + lease_seconds, now, job_id),
+                ).rowcount
+                if running:
+                    self._db.executemany(
+                        "UPDATE job_segments SET translation = ? WHERE job_id = ? AND page = ? AND idx = ?",
+                        [(out, job_id, page, idx) for page, idx, out in results],
+                    )
+                    self._db.execute(
+                        "UPDATE jobs SET done = (SELECT COUNT(*) FROM job_segments "
+                        "WHERE job_id = ? AND translation IS NOT NULL) WHERE id = ?",
+                        (job_id, job_id),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return bool(running)
+
+    def finish(self, job_id: str, status: str = "done", error: Optional[str] = None) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (status, error, time.time(), job_id),
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            return bool(self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            ).rowcount)
+
+    def page_results(self, job_id: str, partial: bool = False) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (page, translated_text) in page order. With `partial`, each
+        page holds its translated segments up to the first missing one.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT page, segment, separator, translation FROM job_segments WHERE job_id = ? ORDER BY page, idx",
+                (job_id,),
+            ).fetchall()
+            pages = self._db.execute("SELECT pages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        by_page: Dict[int, List[Tuple[str, str, Optional[str]]]] = {}
+        for page, segment, separator, translation in rows:
+            by_page.setdefault(page, []).append((segment, separator, translation))
+        for page in range(pages[0] if pages else 0):
+            entries = by_page.get(page, [])
+            if partial:
+                done = 0
+                while done < len(entries) and entries[done][2] is not None:
+                    done += 1
+                entries = entries[:done]
+            translations = [t if t is not None else "" for _, _, t in entries]
+            separators = [""] + [sep for _, sep, _ in entries]
+            yield page, join_sentences(translations, separators) if entries else ""
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class JobWorker:
+    """Background task that processes jobs from the store through the batcher."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        batcher: TranslationBatcher,
+        chunk_segments: int = JOB_CHUNK_SEGMENTS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+    ):
+        self.store = store
+        self.batcher = batcher
+        self.chunk_segments = max(1, chunk_segments)
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # an interrupted job keeps its lease and is resumed once it expires
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim)
+            except sqlite3.Error as e:
+                print(f"[WARN] job claim failed: {e}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                try:
+                    await asyncio.to_thread(self.store.finish, job["id"], "failed", f"Translation error: {e}")
+                except sqlite3.Error as db_error:
+                    # the lease runs out and the job is retried
+                    print(f"[WARN] could not mark job {job['id']} failed: {db_error}")
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        while True:
+            rows = await asyncio.to_thread(self.store.pending, job_id, self.chunk_segments)
+            if not rows:
+                await asyncio.to_thread(self.store.finish, job_id)
+                return
+            items = [(segment, job["source_lang"], job["target_lang"]) for _, _, segment in rows]
+            try:
+                outputs = await self.batcher.translate_many(items, job["profile"], priority=PRIORITY_BACKGROUND)
+            except InferenceBusy as e:
+                # interactive traffic has the queue: back off and keep the lease
+                if not await asyncio.to_thread(self.store.save, job_id, []):
+                    return
+                await asyncio.sleep(e.retry_after)
+                continue
+            results = [(page, idx, out) for (page, idx, _), out in zip(rows, outputs)]
+            if not await asyncio.to_thread(self.store.save, job_id, results):
+                return
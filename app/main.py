@@ -3,13 +3,15 @@
 FastAPI app with:
 - /translate-text  -> text translation (routers/translate.py)
 - /ocr-translate    -> image/pdf OCR (routers/ocr.py)
+- /jobs             -> background translation of long documents (routers/jobs.py)
 
 Uses Tesseract OCR + PyMuPDF (pymupdf). Make sure these are installed in your venv:
     pip install fastapi "uvicorn[standard]" pytesseract pymupdf pillow transformers torch sentencepiece tokenizers huggingface-hub protobuf
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import traceback, sys
 
 # Use shared state module
@@ -17,10 +19,18 @@ import app.state as state
 
 # Import model loader
 from app.model import load_model
+from app.batcher import TranslationBatcher
+from app.cache import create_ocr_cache, create_translation_cache
+from app.continuous import CONTINUOUS_BATCHING, ContinuousBatcher
+from app.executor import InferenceBusy, InferenceExecutor
+from app.jobs import JOBS_DB, JobStore, JobWorker
+import app.ocr_engine as ocr_engine
+import app.ocr_pool as ocr_pool
 
 # Include routers (make sure routers/__init__.py exists)
 from app.routers.translate import router as translate_router
 from app.routers.ocr import router as ocr_router
+from app.routers.jobs import router as jobs_router
 from app.routers.speech import router as speech_router
 
 app = FastAPI(title="NLLB Translation + OCR (Tesseract + PyMuPDF)")
@@ -37,25 +47,92 @@ app.add_middleware(
 # Register routers (optionally add prefixes or tags)
 app.include_router(translate_router)  # routes from routers/translate.py
 app.include_router(ocr_router)        # routes from routers/ocr.py
+app.include_router(jobs_router)       # routes from routers/jobs.py
 # app.include_router(speech_router)
 
+@app.exception_handler(InferenceBusy)
+async def inference_busy_handler(request: Request, exc: InferenceBusy):
+    # Fail fast instead of queueing unbounded latency
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 @app.on_event("startup")
 async def startup_event():
-    # Load translation model into shared state
+    # Blocking OCR / speech work runs on a bounded pool off the event loop
+    state.executor = InferenceExecutor()
+
+    # Load translation model into shared state (already loaded when
+    # running under the pre-fork server, see app/serve.py)
     try:
-        state.model_bundle = load_model()
+        if state.model_bundle is None:
+            state.model_bundle = load_model()
         model_name = state.model_bundle.get("name") if state.model_bundle else None
         print("Translation model loaded:", model_name)
+        state.translation_cache = create_translation_cache()
+        continuous = None
+        if CONTINUOUS_BATCHING and state.model_bundle.get("backend", "torch") == "torch":
+            try:
+                continuous = ContinuousBatcher(state.model_bundle)
+                print("Continuous batching enabled for the fast profile")
+            except ValueError as e:
+                print(f"[WARN] Continuous batching disabled: {e}")
+        state.batcher = TranslationBatcher(
+            state.model_bundle, cache=state.translation_cache, continuous=continuous
+        )
     except Exception:
         state.model_bundle = None
+        state.batcher = None
         print("Failed to load translation model:", file=sys.stderr)
         traceback.print_exc()
 
+    # Background jobs share the batcher at low priority
+    if state.batcher is not None and JOBS_DB:
+        try:
+            state.job_store = JobStore(JOBS_DB)
+            state.job_worker = JobWorker(state.job_store, state.batcher)
+            state.job_worker.start()
+        except Exception:
+            state.job_store = None
+            state.job_worker = None
+            print("Failed to open job store:", file=sys.stderr)
+            traceback.print_exc()
+    elif not JOBS_DB:
+        print("Job API disabled (set JOBS_DB to a SQLite file to enable it)")
+
+    state.ocr_cache = create_ocr_cache()
+
     # Check Tesseract availability
     try:
         import pytesseract
+        from app.ocr_engine import ENGINE
         version = pytesseract.get_tesseract_version()
-        print("Tesseract version:", version)
+        print("Tesseract version:", version, "- OCR engine:", ENGINE)
     except Exception:
         print("Tesseract not available - OCR features will be limited:", file=sys.stderr)
         traceback.print_exc()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if state.job_worker is not None:
+        await state.job_worker.stop()
+        state.job_worker = None
+    if state.job_store is not None:
+        state.job_store.close()
+        state.job_store = None
+    if state.batcher is not None:
+        state.batcher.close(timeout=5)
+        state.batcher = None
+    if state.translation_cache is not None:
+        state.translation_cache.close()
+        state.translation_cache = None
+    if state.ocr_cache is not None:
+        state.ocr_cache.close()
+        state.ocr_cache = None
+    if state.executor is not None:
+        state.executor.shutdown(wait=False)
+        state.executor = None
+    ocr_engine.close()
+    ocr_pool.shutdown()
@@ -1,17 +1,87 @@
 # Paste into app/model.py (replace previous helpers / translate function)
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, LogitsProcessor, LogitsProcessorList
+import transformers
+import math
 import torch
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Optional, Sequence, Tuple
+import os
 import traceback
 
+from app.langdetect import resolve_source_lang
+from app.passthrough import passthrough_text
+from app.segment import split_sentences, join_sentences
+from app.trim_vocab import VOCAB_MAP_FILE, VocabMap
+
 # config (keep your MODEL_NAME and generation settings)
 MODEL_NAME = "facebook/nllb-200-distilled-600M"
-MAX_GEN_LENGTH = 128
 NUM_BEAMS = 4
 EARLY_STOPPING = True
+MAX_INPUT_TOKENS = 1024  # NLLB position limit, including language tag and </s>
+SEGMENT_BATCH_SIZE = 16  # sentence segments per generate call for long inputs
+
+# Generation budget per batch: ceil(ratio * source tokens) + slack new
+# tokens, clamped to [min, max] (override through the environment)
+GEN_LENGTH_RATIO = float(os.getenv("GEN_LENGTH_RATIO", "1.5"))
+GEN_LENGTH_SLACK = int(os.getenv("GEN_LENGTH_SLACK", "10"))
+GEN_MIN_NEW_TOKENS = int(os.getenv("GEN_MIN_NEW_TOKENS", "16"))
+GEN_MAX_NEW_TOKENS = int(os.getenv("GEN_MAX_NEW_TOKENS", "256"))
+
+# Repetition-loop guard: a hypothesis whose tail repeats the same 1..8 token
+# pattern at least 3 times over 8+ tokens is ended with </s>
+REPEAT_MAX_PERIOD = 8
+REPEAT_MIN_REPEATS = 3
+REPEAT_MIN_SPAN = 8
+
+# Named generation profiles, selectable per request
+GENERATION_PROFILES = {
+    # greedy decoding for interactive traffic
+    "fast": {"num_beams": 1},
+    "balanced": {"num_beams": 2, "early_stopping": EARLY_STOPPING},
+    # original settings, for archival / document translation
+    "quality": {"num_beams": NUM_BEAMS, "early_stopping": EARLY_STOPPING},
+}
+DEFAULT_PROFILE = "quality"
+
+# Inference backend: "torch" (default) or "onnx" (ONNX Runtime, CPU)
+BACKEND = os.getenv("NLLB_BACKEND", "torch").lower()
+ONNX_CACHE_DIR = os.getenv(
+    "NLLB_ONNX_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "nllb-onnx"),
+)
+
+# Vocabulary-trimmed model built with `python -m app.trim_vocab` (empty = full model)
+TRIMMED_MODEL_DIR = os.getenv("NLLB_TRIMMED_DIR", "")
+
+# Speculative decoding: a small seq2seq draft model sharing NLLB's vocabulary
+# proposes tokens that the main model verifies (greedy, single-row requests)
+DRAFT_MODEL_NAME = os.getenv("NLLB_DRAFT_MODEL", "")
+DRAFT_NUM_TOKENS = int(os.getenv("NLLB_DRAFT_TOKENS", "5"))
+
+# CPU int8 dynamic quantization of the Linear layers (NLLB_QUANTIZE=1)
+QUANTIZE_INT8 = os.getenv("NLLB_QUANTIZE", "0") == "1"
+QUANTIZED_CACHE_DIR = os.getenv(
+    "NLLB_QUANTIZED_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "nllb-int8"),
+)
 
-def load_model(path: str = None) -> Dict[str, Any]:
-    print(f"Loading tokenizer and model: {MODEL_NAME}")
+# friendly -> NLLB codes (ensure correct values)
+LANG_MAP = {
+    "ne": "npi_Deva",
+    "si": "sin_Sinh",
+    "en": "eng_Latn"
+}
+DEFAULT_SOURCE_LANG = "npi_Deva"
+TARGET_LANG = "eng_Latn"
+
+def load_model(path: str = None, quantize: bool = QUANTIZE_INT8, backend: str = BACKEND) -> Dict[str, Any]:
+    """
+    `path` (or NLLB_TRIMMED_DIR) points at a local model directory; a
+    vocab_map.json next to it marks a vocabulary-trimmed model. The
+    tokenizer always comes from MODEL_NAME.
+    """
+    source = path or TRIMMED_MODEL_DIR or MODEL_NAME
+    print(f"Loading tokenizer and model: {source}")
     try:
         tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
         print("Fast tokenizer loaded.")
@@ -20,8 +90,21 @@ def load_model(path: str = None) -> Dict[str, Any]:
         traceback.print_exc()
         tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=False)
         print("Slow tokenizer loaded.")
-    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME, low_cpu_mem_usage=True)
     device = "cuda" if torch.cuda.is_available() else "cpu"
+    if backend == "onnx":
+        # Same generate() interface, run by ONNX Runtime on CPU
+        device = "cpu"
+        quantize = False
+        model = load_onnx_model(source)
+    elif quantize and device == "cpu":
+        model = load_quantized_model(source)
+    else:
+        if quantize:
+            print("int8 quantization is CPU-only; loading fp32 model on CUDA")
+            quantize = False
+        model = AutoModelForSeq2SeqLM.from_pretrained(source, low_cpu_mem_usage=True)
+    if backend != "onnx":
+        model.eval()
     if device == "cuda":
         try:
             model = model.to(device)
@@ -29,7 +112,278 @@ def load_model(path: str = None) -> Dict[str, Any]:
         except Exception:
             print("Could not move model to CUDA; continuing on CPU")
             device = "cpu"
-    return {"tokenizer": tokenizer, "model": model, "device": device, "name": MODEL_NAME}
+    draft_model = None
+    if DRAFT_MODEL_NAME and backend == "torch":
+        draft_model = load_draft_model(model, device)
+    lang_ids = build_lang_id_table(tokenizer)
+    print(f"Resolved {len(lang_ids)} language token ids.")
+    vocab_map = None
+    if os.path.exists(os.path.join(source, VOCAB_MAP_FILE)):
+        vocab_map = VocabMap.load(source)
+        print(f"Trimmed vocabulary: {len(vocab_map)} of {vocab_map.full_vocab_size} tokens")
+    return {
+        "tokenizer": tokenizer,
+        "model": model,
+        "device": device,
+        "name": source,
+        "vocab_map": vocab_map,
+        "draft_model": draft_model,
+        "lang_ids": lang_ids,
+        "quantized": quantize,
+        "backend": backend,
+    }
+
+def load_onnx_model(source: str = MODEL_NAME):
+    """
+    Load NLLB as ONNX encoder / decoder-with-past graphs on ONNX Runtime's
+    CPU execution provider. The first call exports the model and caches the
+    graphs in ONNX_CACHE_DIR; generate() (beam search included) works as
+    with the torch model.
+    """
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    export_dir = os.path.join(ONNX_CACHE_DIR, _cache_name(source))
+    if os.path.exists(os.path.join(export_dir, "config.json")):
+        model = ORTModelForSeq2SeqLM.from_pretrained(
+            export_dir, use_cache=True, provider="CPUExecutionProvider"
+        )
+        print(f"Loaded ONNX model from {export_dir}")
+        return model
+
+    print("Exporting model to ONNX (one-time)...")
+    model = ORTModelForSeq2SeqLM.from_pretrained(
+        source, export=True, use_cache=True, provider="CPUExecutionProvider"
+    )
+    try:
+        os.makedirs(export_dir, exist_ok=True)
+        model.save_pretrained(export_dir)
+        print(f"Saved ONNX model to {export_dir}")
+    except Exception:
+        print("Could not cache ONNX export; continuing")
+        traceback.print_exc()
+    return model
+
+def load_draft_model(model, device: str, name: str = DRAFT_MODEL_NAME):
+    """
+    Load the assistant model for speculative decoding. It must share the
+    main model's vocabulary; otherwise it is skipped and decoding stays
+    plain greedy.
+    """
+    try:
+        draft = AutoModelForSeq2SeqLM.from_pretrained(name, low_cpu_mem_usage=True)
+    except Exception:
+        print(f"Could not load draft model {name}; speculative decoding disabled")
+        traceback.print_exc()
+        return None
+    if draft.get_input_embeddings().weight.shape[0] != model.get_input_embeddings().weight.shape[0]:
+        print(f"Draft model {name} has a different vocabulary; speculative decoding disabled")
+        return None
+    draft.eval()
+    draft.generation_config.num_assistant_tokens = DRAFT_NUM_TOKENS
+    if device == "cuda":
+        draft = draft.to(device)
+    print(f"Draft model loaded for speculative decoding: {name}")
+    return draft
+
+def quantize_model(model):
+    """Dynamically quantize the Linear layers of a seq2seq model to int8."""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _cache_name(source: str) -> str:
+    """Filesystem-safe name for a hub id or local model directory."""
+    return source.strip("/\\").replace("/", "--").replace("\\", "--").replace(":", "")
+
+def quantized_cache_path(source: str = MODEL_NAME) -> str:
+    # Pickled modules are tied to the torch / transformers versions that wrote them
+    name = _cache_name(source)
+    return os.path.join(
+        QUANTIZED_CACHE_DIR,
+        f"{name}-int8-torch{torch.__version__}-transformers{transformers.__version__}.pt",
+    )
+
+def load_quantized_model(source: str = MODEL_NAME):
+    """
+    Load the int8 model from the on-disk cache, or build it from the fp32
+    weights and cache it so later startups skip quantization.
+    """
+    cache_path = quantized_cache_path(source)
+    if os.path.exists(cache_path):
+        try:
+            model = torch.load(cache_path, map_location="cpu", weights_only=False)
+            print(f"Loaded int8 model from {cache_path}")
+            return model
+        except Exception:
+            print(f"Could not load cached int8 model {cache_path}; re-quantizing")
+            traceback.print_exc()
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(source, low_cpu_mem_usage=True)
+    model.eval()
+    model = quantize_model(model)
+    print("Quantized model Linear layers to int8")
+    try:
+        os.makedirs(QUANTIZED_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, cache_path)
+        print(f"Saved int8 model to {cache_path}")
+    except Exception:
+        print("Could not cache int8 model; continuing")
+        traceback.print_exc()
+    return model
+
+def resolve_target_lang(bundle: Dict[str, Any], lang: str) -> str:
+    """
+    Friendly ("en") or NLLB ("fra_Latn") target code -> NLLB code; raises
+    ValueError if unknown. Only language tags from the precomputed table
+    count: the tokenizer fallback would also resolve ordinary subwords
+    ("de", "fr"), and forcing one of those as BOS produces garbage.
+    """
+    code = LANG_MAP.get(lang, lang)
+    if code not in bundle["lang_ids"] or _model_lang_id(bundle, code) is None:
+        raise ValueError(f"Unknown target language {lang!r}")
+    return code
+
+def resolve_profile(profile: str = None) -> str:
+    """Validate a profile name (None -> DEFAULT_PROFILE); raises ValueError if unknown."""
+    if profile is None:
+        return DEFAULT_PROFILE
+    if profile not in GENERATION_PROFILES:
+        raise ValueError(f"Unknown profile {profile!r}; expected one of {', '.join(GENERATION_PROFILES)}")
+    return profile
+
+def generation_settings(bundle: Dict[str, Any], profile: str = DEFAULT_PROFILE) -> Dict[str, Any]:
+    """Everything besides the text that changes the model output (used for cache keys)."""
+    return {
+        "model": bundle.get("name"),
+        "quantized": bundle.get("quantized", False),
+        "backend": bundle.get("backend", "torch"),
+        "length_budget": [GEN_LENGTH_RATIO, GEN_LENGTH_SLACK, GEN_MIN_NEW_TOKENS, GEN_MAX_NEW_TOKENS],
+        "repeat_guard": [REPEAT_MAX_PERIOD, REPEAT_MIN_REPEATS, REPEAT_MIN_SPAN],
+        **GENERATION_PROFILES[profile],
+    }
+
+def max_new_tokens_for(rows: List[List[int]]) -> int:
+    """Generation budget for a batch, from its longest source row."""
+    src_len = max(len(row) for row in rows) - 2  # language tag and </s>
+    budget = math.ceil(GEN_LENGTH_RATIO * max(src_len, 0)) + GEN_LENGTH_SLACK
+    # +1 for the forced target-language token
+    return max(GEN_MIN_NEW_TOKENS, min(GEN_MAX_NEW_TOKENS, budget)) + 1
+
+def is_repetition_loop(tokens: List[int]) -> bool:
+    """True when the tail of `tokens` is one short pattern repeated over and over."""
+    n = len(tokens)
+    for period in range(1, REPEAT_MAX_PERIOD + 1):
+        span = period * max(REPEAT_MIN_REPEATS, math.ceil(REPEAT_MIN_SPAN / period))
+        if span > n:
+            break
+        tail = tokens[n - span:]
+        if all(tail[i] == tail[i + period] for i in range(span - period)):
+            return True
+    return False
+
+class RepetitionLoopGuard(LogitsProcessor):
+    """
+    Forces </s> as the only next token for hypotheses stuck in a repetition
+    loop, so those beams finish now instead of running to the length limit.
+    """
+
+    def __init__(self, eos_token_id: int, prefix_len: int = 1):
+        self.eos_token_id = eos_token_id
+        self.prefix_len = prefix_len  # decoder start token(s) to ignore
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if input_ids.shape[1] - self.prefix_len < REPEAT_MIN_SPAN:
+            return scores
+        for row, tokens in enumerate(input_ids[:, self.prefix_len:].tolist()):
+            if is_repetition_loop(tokens):
+                scores[row, :] = -float("inf")
+                scores[row, self.eos_token_id] = 0.0
+        return scores
+
+class RowLengthBudget(LogitsProcessor):
+    """
+    Forces </s> as the only next token for hypotheses that have used up their
+    own row's budget (max_new_tokens_for([row])), so short rows sharing a
+    batch with a long one stop where they would have stopped alone.
+    max_new_tokens stays the batch-wide cap.
+    """
+
+    def __init__(self, eos_token_id: int, max_new: torch.LongTensor, prefix_len: int = 1):
+        self.eos_token_id = eos_token_id
+        self.max_new = max_new  # one entry per hypothesis (rows expanded like the batch)
+        self.prefix_len = prefix_len  # decoder start token(s) not counted as new
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self.max_new.device != input_ids.device:
+            self.max_new = self.max_new.to(input_ids.device)
+        done = self.max_new <= input_ids.shape[1] - self.prefix_len
+        if done.any():
+            scores[done, :] = -float("inf")
+            scores[done, self.eos_token_id] = 0.0
+        return scores
+
+def _length_kwargs(
+    bundle: Dict[str, Any], rows: List[List[int]], prefix_len: int = 1, num_beams: int = 1, repeat: int = 1
+) -> Dict[str, Any]:
+    """
+    max_new_tokens, per-row budgets and the repetition guard for one generate
+    call. Each row becomes `repeat` consecutive decoder rows (several targets)
+    of `num_beams` hypotheses each.
+    """
+    eos_id = bundle["model"].config.eos_token_id
+    max_new = torch.tensor([max_new_tokens_for([row]) for row in rows], dtype=torch.long)
+    max_new = max_new.repeat_interleave(repeat * num_beams)
+    return {
+        "max_new_tokens": max_new_tokens_for(rows),
+        "logits_processor": LogitsProcessorList([
+            RowLengthBudget(eos_id, max_new, prefix_len),
+            RepetitionLoopGuard(eos_id, prefix_len),
+        ]),
+    }
+
+def _nllb_lang_codes(tokenizer) -> List[str]:
+    """All NLLB language codes known to the tokenizer (or to transformers)."""
+    codes = list(getattr(tokenizer, "additional_special_tokens", None) or [])
+    try:
+        from transformers.models.nllb.tokenization_nllb import FAIRSEQ_LANGUAGE_CODES
+        codes.extend(FAIRSEQ_LANGUAGE_CODES)
+    except Exception:
+        pass
+    return list(dict.fromkeys(codes))
+
+def build_lang_id_table(tokenizer) -> Mapping[str, int]:
+    """
+    Resolve every NLLB language code to its forced-BOS token id once.
+    Returns a read-only mapping so it can be shared between requests.
+    """
+    table = {}
+    for code in _nllb_lang_codes(tokenizer):
+        lang_id = _get_lang_id_safe(tokenizer, code)
+        if lang_id is not None:
+            table[code] = lang_id
+    return MappingProxyType(table)
+
+def _get_lang_id(bundle: Dict[str, Any], lang_code: str):
+    """O(1) lookup in the precomputed table; slow path only for unknown codes."""
+    lang_ids = bundle.get("lang_ids")
+    if lang_ids is not None and lang_code in lang_ids:
+        return lang_ids[lang_code]
+    return _get_lang_id_safe(bundle["tokenizer"], lang_code)
+
+def _model_lang_id(bundle: Dict[str, Any], lang_code: str):
+    """Language tag id in the model's vocabulary (differs from the tokenizer's when trimmed)."""
+    lang_id = _get_lang_id(bundle, lang_code)
+    vocab_map = bundle.get("vocab_map")
+    if lang_id is None or vocab_map is None:
+        return lang_id
+    return vocab_map.model_id(lang_id)
+
+def decode_outputs(bundle: Dict[str, Any], outputs: torch.Tensor) -> List[str]:
+    """Decode generated model ids (mapped back to tokenizer ids if trimmed)."""
+    vocab_map = bundle.get("vocab_map")
+    if vocab_map is not None:
+        outputs = vocab_map.to_tokenizer(outputs)
+    return bundle["tokenizer"].batch_decode(outputs, skip_special_tokens=True, clean_up_tokenization_spaces=True)
 
 def _get_lang_id_safe(tokenizer, lang_code: str):
     """
@@ -40,22 +394,16 @@ def _get_lang_id_safe(tokenizer, lang_code: str):
     if hasattr(tokenizer, "lang_code_to_id") and lang_code in tokenizer.lang_code_to_id:
         return tokenizer.lang_code_to_id[lang_code]
 
-    vocab = tokenizer.get_vocab()
-
     # 2) try common token forms used by NLLB: "<eng_Latn>" and "<2eng_Latn>"
     candidates = [
+        lang_code,
         f"<{lang_code}>",
         f"<2{lang_code}>",
         f"▁<{lang_code}>",
         f"▁{lang_code}",
-        lang_code
     ]
 
-    for cand in candidates:
-        if cand in vocab:
-            return vocab[cand]
-
-    # 3) fallback: try converting token string to id if tokenizer supports it
+    # 3) convert token string to id (avoids materialising the full vocab dict)
     try:
         for cand in candidates:
             try:
@@ -69,58 +417,208 @@ def _get_lang_id_safe(tokenizer, lang_code: str):
 
     return None
 
-def translate_with_model(bundle: Dict[str, Any], text: str, source_lang: str) -> str:
+def encode_text(bundle: Dict[str, Any], text: str, source_lang: str) -> List[int]:
+    """
+    Tokenize one text for the given source language without touching the
+    shared tokenizer's src_lang, so it is safe to call from many threads.
+    The NLLB language tag and </s> are added here per call.
+    """
     tokenizer = bundle["tokenizer"]
-    model = bundle["model"]
-    device = bundle.get("device", "cpu")
+    src = LANG_MAP.get(source_lang, DEFAULT_SOURCE_LANG)
+    src_id = _get_lang_id(bundle, src)
 
-    # friendly -> NLLB codes (ensure correct values)
-    lang_map = {
-        "ne": "npi_Deva",
-        "si": "sin_Sinh",
-        "en": "eng_Latn"
-    }
-    src = lang_map.get(source_lang, "npi_Deva")
-    tgt = "eng_Latn"
+    # No truncation/padding arguments: changing them mutates the fast
+    # tokenizer's backend state, which is not safe under concurrency.
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    ids = ids[:MAX_INPUT_TOKENS - 2]
 
-    # Set source/tgt on tokenizer when supported
-    try:
-        tokenizer.src_lang = src
-    except Exception:
-        pass
-    try:
-        # some tokenizers support src/tgt attributes
-        tokenizer.tgt_lang = tgt
-    except Exception:
-        pass
+    eos = [tokenizer.eos_token_id]
+    lang = [src_id] if src_id is not None else []
+    if getattr(tokenizer, "legacy_behaviour", False):
+        # legacy NLLB format: tokens </s> src_lang
+        row = ids + eos + lang
+    else:
+        # current NLLB format: src_lang tokens </s>
+        row = lang + ids + eos
+
+    vocab_map = bundle.get("vocab_map")
+    return vocab_map.to_model(row) if vocab_map is not None else row
+
+def _pad_batch(bundle: Dict[str, Any], rows: List[List[int]]) -> Dict[str, torch.Tensor]:
+    """Right-pad token id rows into input_ids / attention_mask tensors."""
+    pad_id = bundle["tokenizer"].pad_token_id
+    max_len = max(len(row) for row in rows)
+    input_ids = torch.full((len(rows), max_len), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(rows), max_len), dtype=torch.long)
+    for i, row in enumerate(rows):
+        input_ids[i, :len(row)] = torch.tensor(row, dtype=torch.long)
+        attention_mask[i, :len(row)] = 1
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+def plan_segments(
+    text: str, source_lang: Optional[str], target_langs: Sequence[str] = (TARGET_LANG,)
+) -> Tuple[List[str], List[str], Optional[str], List[List[Optional[str]]]]:
+    """
+    Front half of every translation path: split `text` into sentence
+    segments, detect a missing source language from the whole text and find
+    the segments that need no translation (see app.passthrough). Returns
+    (segments, separators, source_lang, fixed) where fixed[t][i] is the
+    text to use for segment i in target_langs[t] (NLLB codes), or None when
+    the segment has to go to the model.
+    """
+    segments, separators = split_sentences(text)
+    if segments:
+        source_lang, _ = resolve_source_lang(text, source_lang)
+    src = LANG_MAP.get(source_lang, DEFAULT_SOURCE_LANG)
+    fixed = [[passthrough_text(segment, src, tgt) for segment in segments] for tgt in target_langs]
+    return segments, separators, source_lang, fixed
+
+def translate_ids_batch(
+    bundle: Dict[str, Any],
+    rows: List[List[int]],
+    profile: str = DEFAULT_PROFILE,
+    streamer=None,
+    target_lang: str = TARGET_LANG,
+) -> List[str]:
+    """
+    Translate pre-tokenized rows (see encode_text) with a single padded
+    generate call using the given generation profile. Rows may have
+    different source languages. Output order matches input order.
+    A transformers streamer (single row, greedy profile) receives tokens
+    as they are generated. `target_lang` is an NLLB code.
+    """
+    model = bundle["model"]
+    device = bundle.get("device", "cpu")
+    tgt = target_lang
 
-    # Tokenize input
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True)
+    inputs = _pad_batch(bundle, rows)
 
     # move tensors to device
     if device == "cuda":
         inputs = {k: v.to("cuda") for k, v in inputs.items()}
 
-    # Resolve target language id safely
-    lang_id = _get_lang_id_safe(tokenizer, tgt)
+    # Resolve target language id from the precomputed table
+    lang_id = _model_lang_id(bundle, tgt)
 
-    gen_kwargs = {
-        "max_length": MAX_GEN_LENGTH,
-        "num_beams": NUM_BEAMS,
-        "early_stopping": EARLY_STOPPING,
-    }
+    gen_kwargs = dict(GENERATION_PROFILES[profile])
+    gen_kwargs.update(_length_kwargs(bundle, rows, num_beams=gen_kwargs.get("num_beams", 1)))
+    if streamer is not None:
+        gen_kwargs["streamer"] = streamer
+    draft_model = bundle.get("draft_model")
+    if draft_model is not None and len(rows) == 1 and gen_kwargs.get("num_beams", 1) == 1:
+        # assisted generation: same output as greedy, fewer main-model decoder steps
+        gen_kwargs["assistant_model"] = draft_model
+
+    with torch.inference_mode():
+        if lang_id is not None:
+            # Use forced BOS token for target language
+            outputs = model.generate(
+                **inputs,
+                forced_bos_token_id=lang_id,
+                **gen_kwargs
+            )
+        else:
+            # Log fallback (you can print or logger)
+            print(f"[WARN] Could not find lang-id for target {tgt}; generating without forced_bos.")
+            outputs = model.generate(**inputs, **gen_kwargs)
+
+    return decode_outputs(bundle, outputs)
+
+def translate_batch_with_model(
+    bundle: Dict[str, Any], texts: List[str], source_lang: str, profile: str = DEFAULT_PROFILE
+) -> List[str]:
+    """
+    Translate a list of texts that share the same source language with a
+    single padded generate call. Output order matches input order.
+    """
+    rows = [encode_text(bundle, text, source_lang) for text in texts]
+    return translate_ids_batch(bundle, rows, profile)
+
+def translate_ids_multi_target(
+    bundle: Dict[str, Any], rows: List[List[int]], target_langs: List[str], profile: str = DEFAULT_PROFILE
+) -> List[List[str]]:
+    """
+    Translate pre-tokenized rows into several NLLB target languages with a
+    single encoder pass. Every (row, target) pair becomes one decoder row
+    that starts from the target's language token and shares its row's
+    encoder outputs. Returns outputs[row][target_index].
+    """
+    if bundle.get("backend", "torch") != "torch":
+        # Exported backends can't take precomputed encoder outputs: one pass per target
+        per_target = [translate_ids_batch(bundle, rows, profile, target_lang=tgt) for tgt in target_langs]
+        return [list(row_outputs) for row_outputs in zip(*per_target)]
+
+    from transformers.modeling_outputs import BaseModelOutput
+
+    model = bundle["model"]
+    device = bundle.get("device", "cpu")
+    n_targets = len(target_langs)
+
+    inputs = _pad_batch(bundle, rows)
+    if device == "cuda":
+        inputs = {k: v.to("cuda") for k, v in inputs.items()}
 
-    if lang_id is not None:
-        # Use forced BOS token for target language
+    start_id = model.config.decoder_start_token_id
+    lang_ids = [_model_lang_id(bundle, tgt) for tgt in target_langs]
+    # row-major: (row0, tgt0), (row0, tgt1), ..., (row1, tgt0), ...
+    decoder_input_ids = torch.tensor(
+        [[start_id, lang_id] for _ in rows for lang_id in lang_ids],
+        dtype=torch.long,
+        device=inputs["input_ids"].device,
+    )
+
+    with torch.inference_mode():
+        encoder_outputs = model.get_encoder()(**inputs, return_dict=True)
+        hidden = encoder_outputs.last_hidden_state.repeat_interleave(n_targets, dim=0)
+        attention_mask = inputs["attention_mask"].repeat_interleave(n_targets, dim=0)
         outputs = model.generate(
-            **inputs,
-            forced_bos_token_id=lang_id,
-            **gen_kwargs
+            encoder_outputs=BaseModelOutput(last_hidden_state=hidden),
+            attention_mask=attention_mask,
+            decoder_input_ids=decoder_input_ids,
+            **_length_kwargs(
+                bundle,
+                rows,
+                prefix_len=2,
+                num_beams=GENERATION_PROFILES[profile].get("num_beams", 1),
+                repeat=n_targets,
+            ),
+            **GENERATION_PROFILES[profile]
         )
-    else:
-        # Log fallback (you can print or logger)
-        print(f"[WARN] Could not find lang-id for target {tgt}; generating without forced_bos.")
-        outputs = model.generate(**inputs, **gen_kwargs)
 
-    translated = tokenizer.decode(outputs[0], skip_special_tokens=True, clean_up_tokenization_spaces=True)
-    return translated
+    decoded = decode_outputs(bundle, outputs)
+    return [decoded[i * n_targets:(i + 1) * n_targets] for i in range(len(rows))]
+
+def translate_multi_with_model(
+    bundle: Dict[str, Any],
+    text: str,
+    source_lang: str,
+    target_langs: List[str],
+    profile: str = DEFAULT_PROFILE,
+) -> Dict[str, str]:
+    """
+    Translate a text of any length into several target languages (NLLB
+    codes), encoding each sentence once. Returns {target_lang: translation}.
+    """
+    segments, separators, source_lang, translations = plan_segments(text, source_lang, target_langs)
+    if not segments:
+        return {tgt: "" for tgt in target_langs}
+
+    # a segment goes to the model if any target needs it; passthroughs win below
+    order = sorted(
+        (i for i in range(len(segments)) if any(t[i] is None for t in translations)),
+        key=lambda i: len(segments[i]),
+    )
+    for start in range(0, len(order), SEGMENT_BATCH_SIZE):
+        idx = order[start:start + SEGMENT_BATCH_SIZE]
+        # only decode the targets that need at least one of these segments
+        needed = [t for t in range(len(target_langs)) if any(translations[t][i] is None for i in idx)]
+        rows = [encode_text(bundle, segments[i], source_lang) for i in idx]
+        outputs = translate_ids_multi_target(bundle, rows, [target_langs[t] for t in needed], profile)
+        for i, row_outputs in zip(idx, outputs):
+            for t, out in zip(needed, row_outputs):
+                if translations[t][i] is None:
+                    translations[t][i] = out
+    return {
+        tgt: join_sentences(translations[t], separators)
+        for t, tgt in enumerate(target_langs)
+    }
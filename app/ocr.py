@@ -0,0 +1,281 @@
+# app/ocr.py
+"""
+Tesseract OCR with a confidence-scored strategy.
+
+The first attempt reads the preprocessed image once with every candidate
+language loaded (e.g. "nep+sin+eng") through `image_to_data`, which also
+returns per-word confidences. Only when the mean word confidence is below
+OCR_MIN_CONFIDENCE are a few fallback attempts (other page segmentation
+modes, the original image) run, and the best-scoring candidate wins rather
+than the first non-empty one. Every attempt is reported with its timing.
+Passes run on the engine layer in app.ocr_engine. With
+OCR_PARALLEL_ATTEMPTS > 1 the passes are fanned out over a process pool
+instead (app.ocr_pool) and the first one to reach the bar is returned.
+"""
+import base64
+import io
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageEnhance
+
+from app.langdetect import detect_language
+from app.ocr_engine import TESSERACT_AVAILABLE, image_to_data  # noqa: F401 (re-exported)
+from app.ocr_pool import OCR_PARALLEL_ATTEMPTS, get_pool, reset_pool
+
+# config (override through the environment)
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "60"))  # mean word confidence, 0-100
+OCR_MAX_ATTEMPTS = int(os.getenv("OCR_MAX_ATTEMPTS", "5"))
+
+SCRIPT_MAP = {
+    "Devanagari": "nep",
+    "Sinhala": "sin",
+    "Latin": "eng",
+}
+
+# Map source_lang to Tesseract language codes
+SOURCE_LANG_TO_TESS = {
+    "ne": "nep",
+    "si": "sin",
+    "en": "eng",
+}
+
+# Reverse map for script detection
+TESS_TO_SCRIPT = {
+    "nep": "Devanagari",
+    "sin": "Sinhala",
+    "eng": "Latin",
+}
+
+# Languages loaded together when source_lang isn't given
+COMBINED_LANGS = "nep+sin+eng"
+
+
+def load_image(img_bytes: bytes) -> Image.Image:
+    """Decode an image as RGB, scaled up to at least 300 px per side."""
+    image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+
+    # Ensure minimum size for OCR (Tesseract works better with larger images)
+    width, height = image.size
+    if width < 300 or height < 300:
+        # Scale up if too small (maintain aspect ratio)
+        scale = max(300 / width, 300 / height)
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    return image
+
+
+def dhash(image: Image.Image, size: int = 8) -> str:
+    """
+    Difference hash: 64 bits comparing neighbouring pixels of a 9x8
+    grayscale thumbnail. Survives re-encoding, rescaling and small
+    brightness changes, so re-uploads of the same picture share it.
+    """
+    thumb = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR)
+    pixels = list(thumb.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{size * size // 4}x}"
+
+
+def thumbnail_signature(image: Image.Image, size: int = 64) -> Dict[str, Any]:
+    """
+    Aspect ratio and a size x size grayscale thumbnail (base64), stored with
+    a dhash cache entry so a later hit can be checked against the pixels.
+    """
+    thumb = image.convert("L").resize((size, size), Image.Resampling.BILINEAR)
+    return {"aspect": image.width / image.height, "pixels": base64.b64encode(thumb.tobytes()).decode("ascii")}
+
+
+def same_picture(image: Image.Image, signature: Dict[str, Any], max_diff: float) -> bool:
+    """
+    True when `image` matches a thumbnail_signature: aspect ratio within 2 %
+    and mean absolute thumbnail difference (0-255) at most `max_diff`.
+    """
+    stored = base64.b64decode(signature["pixels"])
+    size = int(len(stored) ** 0.5)
+    if abs(image.width / image.height - signature["aspect"]) > 0.02 * signature["aspect"]:
+        return False
+    current = image.convert("L").resize((size, size), Image.Resampling.BILINEAR).tobytes()
+    if len(current) != len(stored):
+        return False
+    return sum(abs(a - b) for a, b in zip(current, stored)) / len(stored) <= max_diff
+
+
+def preprocess_image(image: Image.Image) -> Image.Image:
+    """Preprocess image for better OCR results"""
+    # Convert to grayscale for better OCR
+    if image.mode != 'L':
+        image = image.convert('L')
+
+    # Enhance contrast moderately (1.5x instead of 2.0x)
+    enhancer = ImageEnhance.Contrast(image)
+    image = enhancer.enhance(1.5)
+
+    # Enhance sharpness moderately
+    enhancer = ImageEnhance.Sharpness(image)
+    image = enhancer.enhance(1.5)
+
+    # Apply slight denoise only if needed
+    # image = image.filter(ImageFilter.MedianFilter(size=3))
+
+    return image
+
+
+class OCRAttempt:
+    """One Tesseract pass: what was read, how confidently, and how long it took."""
+
+    __slots__ = ("lang", "psm", "variant", "text", "confidence", "words", "seconds", "error")
+
+    def __init__(self, lang: str, psm: str, variant: str):
+        self.lang = lang
+        self.psm = psm
+        self.variant = variant  # "processed" | "original"
+        self.text = ""
+        self.confidence = 0.0
+        self.words = 0
+        self.seconds = 0.0
+        self.error: Optional[str] = None
+
+    @property
+    def score(self) -> Tuple[float, int]:
+        return (self.confidence, self.words) if self.text else (-1.0, 0)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "lang": self.lang,
+            "psm": self.psm,
+            "variant": self.variant,
+            "confidence": round(self.confidence, 1),
+            "words": self.words,
+            "ms": round(self.seconds * 1000, 1),
+            "error": self.error,
+        }
+
+
+def parse_data(data: Dict[str, List[Any]]) -> Tuple[str, float, int]:
+    """
+    Rebuild text from `image_to_data` output (one line per Tesseract line)
+    and return (text, mean word confidence, word count).
+    """
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        confidence = float(data["conf"][i])
+        if not word or confidence < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    mean = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, mean, len(confidences)
+
+
+def run_attempt(image: Image.Image, attempt: OCRAttempt) -> OCRAttempt:
+    start = time.perf_counter()
+    try:
+        data = image_to_data(image, attempt.lang, attempt.psm)
+        attempt.text, attempt.confidence, attempt.words = parse_data(data)
+    except Exception as e:
+        print(f"OCR failed for language {attempt.lang} with PSM {attempt.psm}: {e}")
+        attempt.error = str(e)
+    attempt.seconds = time.perf_counter() - start
+    return attempt
+
+
+def ocr_languages(source_lang: Optional[str]) -> str:
+    """Tesseract language string for a friendly source language (None = all)."""
+    forced = SOURCE_LANG_TO_TESS.get(source_lang) if source_lang else None
+    if forced is None:
+        return COMBINED_LANGS
+    # English words are common in Nepali / Sinhala documents
+    return forced if forced == "eng" else f"{forced}+eng"
+
+
+def candidate_attempts(source_lang: Optional[str]) -> List[OCRAttempt]:
+    """The first pass followed by the fallbacks, at most OCR_MAX_ATTEMPTS."""
+    langs = ocr_languages(source_lang)
+    candidates = [
+        (langs, "6", "processed"),
+        (langs, "3", "processed"),
+        (langs, "11", "processed"),
+        (langs, "6", "original"),
+        (COMBINED_LANGS, "6", "processed"),
+    ]
+    candidates = list(dict.fromkeys(candidates))[:max(1, OCR_MAX_ATTEMPTS)]
+    return [OCRAttempt(lang, psm, variant) for lang, psm, variant in candidates]
+
+
+def extract_text(
+    image: Image.Image, processed_image: Image.Image, source_lang: Optional[str] = None
+) -> Tuple[OCRAttempt, List[OCRAttempt]]:
+    """
+    Blocking OCR of one image. Returns (best attempt, all attempts); the
+    fallbacks only run while no attempt reaches OCR_MIN_CONFIDENCE.
+    """
+    if OCR_PARALLEL_ATTEMPTS > 1:
+        try:
+            return extract_text_parallel(image, processed_image, source_lang, OCR_PARALLEL_ATTEMPTS)
+        except BrokenProcessPool as e:
+            print(f"[WARN] OCR process pool failed ({e}); running passes in this thread")
+            reset_pool()
+
+    images = {"processed": processed_image, "original": image}
+    attempts: List[OCRAttempt] = []
+    for attempt in candidate_attempts(source_lang):
+        attempts.append(run_attempt(images[attempt.variant], attempt))
+        if attempt.text and attempt.confidence >= OCR_MIN_CONFIDENCE:
+            break
+    return max(attempts, key=lambda a: a.score), attempts
+
+
+def extract_text_parallel(
+    image: Image.Image, processed_image: Image.Image, source_lang: Optional[str], max_parallel: int
+) -> Tuple[OCRAttempt, List[OCRAttempt]]:
+    """
+    extract_text over the OCR process pool: up to `max_parallel` passes of
+    this request run at once, in candidate order. The first pass to reach
+    OCR_MIN_CONFIDENCE wins; passes not started yet are cancelled, running
+    ones finish in the background and are discarded.
+    """
+    pool = get_pool()
+    images = {"processed": processed_image, "original": image}
+    waiting = candidate_attempts(source_lang)
+    running = {}
+    attempts: List[OCRAttempt] = []
+    try:
+        while waiting or running:
+            while waiting and len(running) < max_parallel:
+                attempt = waiting.pop(0)
+                running[pool.submit(run_attempt, images[attempt.variant], attempt)] = attempt
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                attempt = future.result()
+                attempts.append(attempt)
+                if attempt.text and attempt.confidence >= OCR_MIN_CONFIDENCE:
+                    return attempt, attempts
+    finally:
+        for future in running:
+            future.cancel()
+    return max(attempts, key=lambda a: a.score), attempts
+
+
+def describe_text(text: str, source_lang: Optional[str] = None) -> Tuple[str, str, float]:
+    """(script, Tesseract language, confidence) of extracted text."""
+    script, lang, confidence = detect_language(text)
+    if script is None:
+        # no letters: fall back to what was asked for
+        tess = SOURCE_LANG_TO_TESS.get(source_lang, "eng") if source_lang else "eng"
+        return TESS_TO_SCRIPT.get(tess, "Latin"), tess, 0.0
+    return script, SCRIPT_MAP[script], confidence
@@ -0,0 +1,138 @@
+# app/ocr_engine.py
+"""
+Tesseract engine layer.
+
+With the tesserocr bindings installed, OCR runs in-process on warm
+PyTessBaseAPI handles: up to OCR_POOL_SIZE handles per language string are
+created on first use, keep their traineddata loaded and receive PIL images
+in memory. Without tesserocr (or with OCR_ENGINE=pytesseract) every call
+goes through pytesseract, which starts a tesseract process per call.
+
+Both paths return word data in pytesseract's `image_to_data` dict layout.
+"""
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:  # optional: pip install tesserocr
+    tesserocr = None
+
+# config (override through the environment)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")  # "auto" | "tesserocr" | "pytesseract"
+OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", "2"))  # warm handles per language
+TESSDATA_DIR = os.getenv("TESSDATA_PREFIX", "")  # empty = tesseract's default
+
+# Configure Tesseract path
+if os.name == "nt":
+    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+else:
+    pytesseract.pytesseract.tesseract_cmd = "/usr/bin/tesseract"
+
+if OCR_ENGINE == "tesserocr" and tesserocr is None:
+    print("[WARN] OCR_ENGINE=tesserocr but tesserocr is not installed; using pytesseract")
+ENGINE = "tesserocr" if tesserocr is not None and OCR_ENGINE != "pytesseract" else "pytesseract"
+
+# Check Tesseract availability
+TESSERACT_AVAILABLE = True
+try:
+    if ENGINE == "tesserocr":
+        _ = tesserocr.tesseract_version()
+    else:
+        _ = pytesseract.get_tesseract_version()
+except Exception:
+    TESSERACT_AVAILABLE = False
+
+
+class TesseractPool:
+    """Warm PyTessBaseAPI handles per language string; each is used by one thread at a time."""
+
+    def __init__(self, size: int = OCR_POOL_SIZE, path: str = TESSDATA_DIR):
+        self.size = max(1, size)
+        self.path = path
+        self._idle: Dict[str, "queue.LifoQueue"] = {}
+        self._created: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, lang: str) -> Iterator[Any]:
+        with self._lock:
+            idle = self._idle.setdefault(lang, queue.LifoQueue())
+            create = idle.empty() and self._created.get(lang, 0) < self.size
+            if create:
+                self._created[lang] = self._created.get(lang, 0) + 1
+        if create:
+            try:
+                kwargs = {"path": self.path} if self.path else {}
+                api = tesserocr.PyTessBaseAPI(lang=lang, **kwargs)
+            except Exception:
+                with self._lock:
+                    self._created[lang] -= 1
+                raise
+        else:
+            api = idle.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            idle.put(api)
+
+    def close(self) -> None:
+        with self._lock:
+            for idle in self._idle.values():
+                while not idle.empty():
+                    idle.get_nowait().End()
+            self._idle.clear()
+            self._created.clear()
+
+
+_pool = TesseractPool() if ENGINE == "tesserocr" else None
+
+
+def _tesserocr_data(image: Image.Image, lang: str, psm: str) -> Dict[str, List[Any]]:
+    RIL = tesserocr.RIL
+    data: Dict[str, List[Any]] = {"text": [], "conf": [], "block_num": [], "par_num": [], "line_num": []}
+    with _pool.acquire(lang) as api:
+        api.SetPageSegMode(int(psm))
+        api.SetImage(image)
+        api.Recognize()
+        iterator = api.GetIterator()
+        if iterator is None:  # nothing on the page
+            return data
+        block = par = line = 0
+        for word in tesserocr.iterate_level(iterator, RIL.WORD):
+            if word.IsAtBeginningOf(RIL.BLOCK):
+                block += 1
+            if word.IsAtBeginningOf(RIL.PARA):
+                par += 1
+            if word.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+            data["text"].append(word.GetUTF8Text(RIL.WORD) or "")
+            data["conf"].append(word.Confidence(RIL.WORD))
+            data["block_num"].append(block)
+            data["par_num"].append(par)
+            data["line_num"].append(line)
+    return data
+
+
+def image_to_data(image: Image.Image, lang: str, psm: str) -> Dict[str, List[Any]]:
+    """Word text / confidence / block, paragraph and line numbers of one OCR pass."""
+    if _pool is not None:
+        return _tesserocr_data(image, lang, psm)
+    return pytesseract.image_to_data(
+        image,
+        lang=lang,
+        config=f"--oem 3 --psm {psm}",
+        output_type=pytesseract.Output.DICT,
+    )
+
+
+def close() -> None:
+    if _pool is not None:
+        _pool.close()
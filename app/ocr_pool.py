@@ -0,0 +1,54 @@
+# app/ocr_pool.py
+"""
+Process pool for parallel OCR passes (see extract_text_parallel in app/ocr.py).
+
+Workers are spawned rather than forked, so they don't inherit the
+translation model or the parent's threads, and they set OMP_THREAD_LIMIT
+before Tesseract is imported so that parallel passes don't oversubscribe
+the CPU. This module is imported by the workers first and must stay free
+of heavy imports.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# config (override through the environment)
+OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", str(max(1, (os.cpu_count() or 2) // 2))))
+OCR_PARALLEL_ATTEMPTS = int(os.getenv("OCR_PARALLEL_ATTEMPTS", "0"))  # per request; 0/1 = sequential
+OCR_OMP_THREAD_LIMIT = os.getenv("OCR_OMP_THREAD_LIMIT", "1")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def init_worker(thread_limit: str) -> None:
+    os.environ["OMP_THREAD_LIMIT"] = thread_limit
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """The shared OCR process pool, started on first use."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, OCR_PROCESSES),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(OCR_OMP_THREAD_LIMIT,),
+            )
+        return _pool
+
+
+def reset_pool() -> None:
+    """Drop a broken pool so the next get_pool() starts a new one."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown() -> None:
+    reset_pool()
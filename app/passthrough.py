@@ -0,0 +1,51 @@
+# app/passthrough.py
+"""
+Pre-translation classifier: decide which segments need the model at all.
+
+Segments are returned unchanged when the source and target language are the
+same, when they contain no letters (numbers, punctuation, symbols), when
+every word is a URL, e-mail address or letter-free token, or when an
+English target is requested and the segment is already written entirely in
+Latin script although the source language is not. Everything else goes to
+NLLB.
+"""
+import re
+import unicodedata
+from typing import Optional
+
+# Latin-script lines are assumed to be English already when translating into these
+LATIN_TARGETS = {"eng_Latn"}
+
+_URL_OR_EMAIL = re.compile(r"^[(\[<\"']*(?:(?:https?://|www\.)\S+|[\w.+-]+@[\w-]+(?:\.[\w-]+)+)[)\]>\"'.,;:!?]*$", re.I)
+
+# Latin, Latin-1 Supplement, Latin Extended-A/B and IPA all sit below U+0250
+_LATIN_END = 0x0250
+
+
+def _letters(text: str):
+    return [ch for ch in text if unicodedata.category(ch).startswith("L")]
+
+
+def _is_non_linguistic(word: str) -> bool:
+    return not _letters(word) or bool(_URL_OR_EMAIL.match(word))
+
+
+def passthrough_text(segment: str, source: str, target: str) -> Optional[str]:
+    """
+    `source` / `target` are NLLB codes. Returns the text to use instead of a
+    translation, or None when the segment has to be translated.
+    """
+    if source == target:
+        return segment
+
+    words = segment.split()
+    if all(_is_non_linguistic(word) for word in words):
+        return segment
+
+    if target in LATIN_TARGETS and not source.endswith("_Latn"):
+        letters = _letters(segment)
+        if letters and all(ord(ch) < _LATIN_END for ch in letters):
+            # e.g. an English line inside Nepali OCR output
+            return segment
+
+    return None
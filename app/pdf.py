@@ -0,0 +1,115 @@
+# app/pdf.py
+"""
+PDF pages for /ocr-translate-pdf, read with PyMuPDF.
+
+Pages with an embedded text layer are taken as they are and never reach
+Tesseract. Pages with images and no text, or less than PDF_MIN_TEXT_CHARS
+of it (a caption or page number over a scan), are rasterized at a DPI
+matched to the resolution of the scanned images they contain, clamped to
+PDF_MIN_DPI..PDF_MAX_DPI, and OCR'd. A short text layer is kept: it is
+merged with the OCR text rather than replaced by it.
+
+A fitz.Document is not thread-safe, so reading and rasterizing take the
+document's lock; OCR of the rendered image runs outside it.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from app.ocr import describe_text, extract_text, preprocess_image
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+# config (override through the environment)
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "200"))
+PDF_PAGE_CONCURRENCY = int(os.getenv("PDF_PAGE_CONCURRENCY", "2"))
+PDF_BUSY_RETRIES = int(os.getenv("PDF_BUSY_RETRIES", "3"))  # per page, with exponential backoff
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "20"))  # fewer = also OCR the page if it has images
+PDF_MIN_DPI = int(os.getenv("PDF_MIN_DPI", "150"))
+PDF_MAX_DPI = int(os.getenv("PDF_MAX_DPI", "400"))
+PDF_DEFAULT_DPI = 300
+
+
+class PDFDocument:
+    """An opened PDF plus the lock that serializes PyMuPDF calls on it."""
+
+    def __init__(self, data: bytes):
+        self.doc = fitz.open(stream=data, filetype="pdf")
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.doc.page_count
+
+    def close(self) -> None:
+        with self.lock:
+            self.doc.close()
+
+
+def adaptive_dpi(page) -> int:
+    """
+    DPI at which the page's largest scanned image is rendered at its own
+    resolution (pixels per inch of its on-page box), clamped to the limits.
+    """
+    dpi = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        if x1 - x0 > 0 and info.get("width"):
+            # PDF user space is 72 points per inch
+            dpi = max(dpi, info["width"] / ((x1 - x0) / 72.0))
+    if dpi <= 0:
+        return PDF_DEFAULT_DPI
+    return int(min(PDF_MAX_DPI, max(PDF_MIN_DPI, dpi)))
+
+
+def render_page(page, dpi: int) -> Image.Image:
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def merge_text(layer: str, ocr: str) -> str:
+    """Text layer and OCR text of one page, without repeating the layer if OCR read it too."""
+    if not layer:
+        return ocr
+    if " ".join(layer.split()) in " ".join(ocr.split()):
+        return ocr
+    return f"{layer}\n\n{ocr}" if ocr else layer
+
+
+def process_page(pdf: PDFDocument, number: int, source_lang: Optional[str]) -> Dict[str, Any]:
+    """
+    Blocking: text of one page (0-based `number`) from its text layer or
+    OCR. Runs on the inference executor.
+    """
+    start = time.perf_counter()
+    with pdf.lock:
+        page = pdf.doc[number]
+        text = page.get_text("text").strip()
+        has_images = bool(page.get_images(full=False))
+        if text and (len(text) >= PDF_MIN_TEXT_CHARS or not has_images):
+            source, dpi, image = "text", None, None
+        elif has_images:
+            source, dpi = ("text+ocr" if text else "ocr"), adaptive_dpi(page)
+            image = render_page(page, dpi)
+        else:
+            source, dpi, image = "empty", None, None
+
+    result: Dict[str, Any] = {"page": number + 1, "source": source, "dpi": dpi, "ocr_confidence": None}
+    if image is not None:
+        best, attempts = extract_text(image, preprocess_image(image.copy()), source_lang)
+        text = merge_text(text, best.text)
+        result["ocr_confidence"] = round(best.confidence, 1) if best.text else None
+        result["ocr_attempts"] = len(attempts)
+    script, detected_lang, _ = describe_text(text, source_lang)
+    result.update(
+        extracted_text=text,
+        detected_script=script,
+        detected_language=detected_lang,
+        ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+    return result
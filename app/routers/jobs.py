@@ -0,0 +1,97 @@
+# app/routers/jobs.py
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import app.state as state
+from app.schemas import JobCreateRequest, JobStatusResponse
+from app.langdetect import resolve_source_lang
+from app.model import TARGET_LANG, resolve_profile, resolve_target_lang
+
+router = APIRouter(tags=["jobs"])
+
+
+def _store():
+    if state.job_store is None or state.model_bundle is None:
+        raise HTTPException(status_code=503, detail="Job API not available (set JOBS_DB to enable it).")
+    return state.job_store
+
+
+# JobStore calls block on SQLite, so they run in worker threads
+async def _job_or_404(job_id: str):
+    job = await asyncio.to_thread(_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+def _page_texts(job_id: str, partial: bool):
+    return [text for _, text in state.job_store.page_results(job_id, partial=partial)]
+
+
+async def _status(job, partial: bool = False) -> JobStatusResponse:
+    partial_results = None
+    if partial:
+        partial_results = await asyncio.to_thread(_page_texts, job["id"], True)
+    return JobStatusResponse(
+        job_id=job["id"],
+        status=job["status"],
+        total_segments=job["total"],
+        done_segments=job["done"],
+        progress=job["done"] / job["total"] if job["total"] else 1.0,
+        error=job["error"],
+        partial_results=partial_results,
+    )
+
+
+@router.post("/jobs", response_model=JobStatusResponse, status_code=202)
+async def create_job(payload: JobCreateRequest):
+    """Queue a long text (or several pages) for background translation."""
+    store = _store()
+    if payload.pages is not None:
+        pages = payload.pages
+    elif payload.text is not None:
+        pages = [payload.text]
+    else:
+        raise HTTPException(status_code=400, detail="text or pages is required")
+    pages = [(page or "").strip() for page in pages]
+    if not any(pages):
+        raise HTTPException(status_code=400, detail="Empty text")
+
+    try:
+        profile = resolve_profile(payload.profile)
+        target = resolve_target_lang(state.model_bundle, payload.target_lang) if payload.target_lang else TARGET_LANG
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    source_lang, _ = resolve_source_lang("\n".join(pages), payload.source_lang)
+    job = await asyncio.to_thread(store.create, pages, source_lang, target, profile)
+    return await _status(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str, partial: bool = False):
+    """Progress of a job; with `?partial=true`, `partial_results` holds each page translated so far."""
+    return await _status(await _job_or_404(job_id), partial)
+
+
+@router.get("/jobs/{job_id}/results")
+async def job_results(job_id: str):
+    """Stream the finished translation as NDJSON: one {"page", "translated_text"} line per page."""
+    job = await _job_or_404(job_id)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    texts = await asyncio.to_thread(_page_texts, job_id, False)
+
+    def body():
+        for page, text in enumerate(texts):
+            yield json.dumps({"page": page, "translated_text": text}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@router.delete("/jobs/{job_id}", response_model=JobStatusResponse)
+async def cancel_job(job_id: str):
+    await _job_or_404(job_id)
+    await asyncio.to_thread(state.job_store.cancel, job_id)
+    return await _status(await _job_or_404(job_id))
@@ -1,226 +1,266 @@
 # app/routers/ocr.py
 from fastapi import APIRouter, HTTPException
-from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
+from fastapi.responses import StreamingResponse
+import asyncio
 import base64
-import io
+import hashlib
+import json
 import os
-from app.schemas import OCRRequest, OCRResponse
+import time
+import traceback
+from app.schemas import OCRRequest, OCRResponse, PDFRequest
+from app.cache import ocr_cache_key
+from app.executor import InferenceBusy
+from app.model import DEFAULT_PROFILE, TARGET_LANG, generation_settings
+from app.ocr import (
+    TESSERACT_AVAILABLE,
+    describe_text,
+    dhash,
+    extract_text,
+    load_image,
+    preprocess_image,
+    same_picture,
+    thumbnail_signature,
+)
+from app.pdf import PDF_BUSY_RETRIES, PDF_MAX_PAGES, PDF_PAGE_CONCURRENCY, PDFDocument, fitz, process_page
 import app.state as state
 
 router = APIRouter(tags=["ocr"])
 
-# Configure Tesseract path
-if os.name == "nt":
-    pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-else:
-    pytesseract.pytesseract.tesseract_cmd = "/usr/bin/tesseract"
-
-# Check Tesseract availability
-TESSERACT_AVAILABLE = True
-try:
-    _ = pytesseract.get_tesseract_version()
-except Exception:
-    TESSERACT_AVAILABLE = False
-
-def preprocess_image(image: Image.Image) -> Image.Image:
-    """Preprocess image for better OCR results"""
-    # Convert to grayscale for better OCR
-    if image.mode != 'L':
-        image = image.convert('L')
-    
-    # Enhance contrast moderately (1.5x instead of 2.0x)
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(1.5)
-    
-    # Enhance sharpness moderately
-    enhancer = ImageEnhance.Sharpness(image)
-    image = enhancer.enhance(1.5)
-    
-    # Apply slight denoise only if needed
-    # image = image.filter(ImageFilter.MedianFilter(size=3))
-    
-    return image
-
-def detect_script(image: Image.Image):
-    """Detect script using Tesseract OSD"""
+# Also look results up by perceptual hash (catches re-encoded / resized uploads).
+# Off by default: different pictures can share a dHash, so a hit is only
+# served after its stored thumbnail matches the upload.
+OCR_CACHE_PHASH = os.getenv("OCR_CACHE_PHASH", "0") == "1"
+OCR_CACHE_PHASH_MAX_DIFF = float(os.getenv("OCR_CACHE_PHASH_MAX_DIFF", "4"))  # mean abs. thumbnail difference, 0-255
+
+# Cache lookups may read SQLite: these run in worker threads (or on the executor)
+def _cached_response(key):
+    cached = state.ocr_cache.get(key)
+    return OCRResponse(**cached, cached=True) if cached is not None else None
+
+def _similar_response(key, image):
+    """The dHash entry under `key`, if its thumbnail matches `image`."""
+    cached = state.ocr_cache.get(key)
+    # entries written before signatures were stored can't be checked: skip them
+    if cached is None or "signature" not in cached:
+        return None
+    if not same_picture(image, cached["signature"], OCR_CACHE_PHASH_MAX_DIFF):
+        return None
+    return OCRResponse(**cached["response"], cached=True)
+
+def _translation_settings():
+    """What the cached translated_text depends on besides the image (None: no model)."""
+    if state.batcher is None or state.model_bundle is None:
+        return None
+    return {"target_lang": TARGET_LANG, **generation_settings(state.model_bundle, DEFAULT_PROFILE)}
+
+class _InvalidImage(Exception):
+    """The upload could not be decoded as an image."""
+
+def _read_image(img_bytes, source_lang, settings):
+    """
+    Blocking, on the inference executor: decode the image, look it up by
+    dHash (OCR_CACHE_PHASH) and otherwise preprocess and OCR it. Returns
+    (cached response or None, dHash key or None, image, best attempt, attempts).
+    """
     try:
-        osd_data = pytesseract.image_to_osd(image)
-        for line in osd_data.split("\n"):
-            if "Script" in line:
-                return line.split(":")[1].strip()
-    except Exception:
-        return "Latin"
-    return "Latin"
-
-SCRIPT_MAP = {
-    "Devanagari": "nep",
-    "Sinhala": "sin", 
-    "Latin": "eng",
-}
-
-# Map source_lang to Tesseract language codes
-SOURCE_LANG_TO_TESS = {
-    "ne": "nep",
-    "si": "sin",
-    "en": "eng",
-}
-
-# Reverse map for script detection
-TESS_TO_SCRIPT = {
-    "nep": "Devanagari",
-    "sin": "Sinhala",
-    "eng": "Latin",
-}
+        image = load_image(img_bytes)
+    except Exception as e:
+        raise _InvalidImage(str(e)) from e
+    phash_key = None
+    if state.ocr_cache is not None and OCR_CACHE_PHASH:
+        phash_key = ocr_cache_key(dhash(image), source_lang, settings, kind="dhash")
+        cached = _similar_response(phash_key, image)
+        if cached is not None:
+            return cached, phash_key, image, None, []
+    # Preprocess image for OCR (grayscale, contrast, sharpness)
+    processed_image = preprocess_image(image.copy())
+    best, attempts = extract_text(image, processed_image, source_lang)
+    return None, phash_key, image, best, attempts
+
+def _store_response(exact_key, phash_key, value, image):
+    state.ocr_cache.set(exact_key, value)
+    if phash_key is not None:
+        state.ocr_cache.set(phash_key, {"response": value, "signature": thumbnail_signature(image)})
 
 @router.post("/ocr-translate", response_model=OCRResponse)
 async def ocr_process(request: OCRRequest):
     """
     OCR endpoint that processes base64 image and returns extracted text with optional translation
     """
-    
+
     if not TESSERACT_AVAILABLE:
         raise HTTPException(
-            status_code=503, 
+            status_code=503,
             detail="Tesseract not installed. Please install Tesseract OCR."
         )
 
     # Validate input
     if not request.image_base64:
         raise HTTPException(status_code=400, detail="image_base64 is required")
-    
+
     try:
         # Handle data URL format and strip whitespace
         b64_data = request.image_base64.strip()
         if b64_data.startswith("data:"):
             b64_data = b64_data.split(",", 1)[1]
-        
+
         # Decode base64
         img_bytes = base64.b64decode(b64_data, validate=True)
         if len(img_bytes) == 0:
             raise HTTPException(status_code=400, detail="Decoded image is empty")
-            
-        image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        
-        # Ensure minimum size for OCR (Tesseract works better with larger images)
-        width, height = image.size
-        if width < 300 or height < 300:
-            # Scale up if too small (maintain aspect ratio)
-            scale = max(300 / width, 300 / height)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Create a copy for script detection (keep original)
-        script_detection_image = image.copy()
-        
-        # Preprocess image for OCR (grayscale, contrast, sharpness)
-        processed_image = preprocess_image(image.copy())
-        
+
+        # Same bytes: skip decoding entirely. A different model or generation
+        # profile changes translated_text, so it is part of the key.
+        settings = _translation_settings()
+        exact_key = ocr_cache_key(hashlib.sha256(img_bytes).hexdigest(), request.source_lang, settings)
+        if state.ocr_cache is not None:
+            cached = await asyncio.to_thread(_cached_response, exact_key)
+            if cached is not None:
+                return cached
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
 
-    # Determine OCR language - use source_lang if provided, otherwise detect
-    forced_lang = None
-    if request.source_lang and request.source_lang in SOURCE_LANG_TO_TESS:
-        forced_lang = SOURCE_LANG_TO_TESS[request.source_lang]
-        script = TESS_TO_SCRIPT.get(forced_lang, "Unknown")
-    else:
-        # Detect script automatically using original image
-        script = detect_script(script_detection_image)
-        forced_lang = SCRIPT_MAP.get(script, "eng")
-
-    # Perform OCR with fallback strategy
-    text = ""
-    detected_lang = forced_lang if forced_lang else "eng"
-    languages_to_try = []
-    
-    if forced_lang:
-        languages_to_try.append(forced_lang)
-    
-    # Add fallback languages
-    if forced_lang != "eng":
-        languages_to_try.append("eng")
-    if forced_lang not in ["nep", "eng"]:
-        languages_to_try.append("nep")
-    if forced_lang not in ["sin", "eng"]:
-        languages_to_try.append("sin")
-    
-    # Remove duplicates while preserving order
-    languages_to_try = list(dict.fromkeys(languages_to_try))
-    
-    # Try different PSM modes for better text extraction
-    # PSM modes: 3 (fully automatic), 6 (uniform block), 7 (single text line), 11 (sparse text), 12 (text with OSD)
-    psm_modes = ['6', '3', '7', '11']
-    
-    # Try OCR with multiple languages and PSM modes
-    for lang in languages_to_try:
-        for psm in psm_modes:
-            try:
-                ocr_config = f'--oem 3 --psm {psm}'
-                text = pytesseract.image_to_string(processed_image, lang=lang, config=ocr_config).strip()
-                if text and len(text) > 0:
-                    # Update script and lang based on successful extraction
-                    detected_lang = lang
-                    script = TESS_TO_SCRIPT.get(lang, script)
-                    break
-            except Exception as e:
-                print(f"OCR failed for language {lang} with PSM {psm}: {e}")
-                continue
-        
-        if text:
-            break
-    
-    # If still no text, try with original image (not preprocessed)
-    if not text:
-        for lang in languages_to_try:
-            for psm in ['6', '3']:
-                try:
-                    ocr_config = f'--oem 3 --psm {psm}'
-                    text = pytesseract.image_to_string(image, lang=lang, config=ocr_config).strip()
-                    if text and len(text) > 0:
-                        detected_lang = lang
-                        script = TESS_TO_SCRIPT.get(lang, script)
-                        break
-                except Exception as e:
-                    continue
-            if text:
-                break
-    
-    # Last resort - try with no language specified (defaults to English)
-    if not text:
-        try:
-            text = pytesseract.image_to_string(processed_image, config='--oem 3 --psm 6').strip()
-            if not text:
-                text = pytesseract.image_to_string(processed_image, config='--oem 3 --psm 3').strip()
-            if text:
-                detected_lang = "eng"
-                script = "Latin"
-        except Exception as e:
-            # Final fallback
-            try:
-                text = pytesseract.image_to_string(processed_image).strip()
-                if text:
-                    detected_lang = "eng"
-                    script = "Latin"
-            except Exception as e2:
-                pass  # Will return empty text if all fails
+    if state.executor is None:
+        raise HTTPException(status_code=503, detail="Inference executor not running.")
+
+    # Decoding, hashing, preprocessing and OCR run off the event loop on the
+    # bounded inference executor
+    try:
+        cached, phash_key, image, best, attempts = await state.executor.run(
+            _read_image, img_bytes, request.source_lang, settings
+        )
+    except _InvalidImage as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
+    if cached is not None:
+        return cached
+
+    text = best.text
+    script, detected_lang, language_confidence = describe_text(text, request.source_lang)
 
     # Optional translation
     translated_text = None
-    
-    if state.model_bundle and text:
+
+    if state.batcher and text:
         try:
-            from app.model import translate_with_model
             source_map = {"nep": "ne", "sin": "si", "eng": "en"}
             source_lang = source_map.get(detected_lang, request.source_lang or "ne")
-            translated_text = translate_with_model(state.model_bundle, text, source_lang)
+            translated_text = await state.batcher.translate(text, source_lang)
+        except InferenceBusy:
+            raise
         except Exception as e:
             print(f"Translation failed: {e}")
 
-    return OCRResponse(
+    response = OCRResponse(
         detected_script=script,
         detected_language=detected_lang,
         extracted_text=text,
-        translated_text=translated_text
+        translated_text=translated_text,
+        language_confidence=language_confidence if text else None,
+        ocr_confidence=round(best.confidence, 1) if text else None,
+        ocr_attempts=[attempt.report() for attempt in attempts],
     )
+    # Don't keep a result whose translation failed (e.g. the queue was full)
+    if state.ocr_cache is not None and (translated_text is not None or not text):
+        # cache hits run no OCR passes, so they report none
+        value = response.model_dump(exclude={"cached", "ocr_attempts"})
+        await asyncio.to_thread(_store_response, exact_key, phash_key, value, image)
+    return response
+
+async def _retry_busy(run, *args):
+    """
+    Await run(*args), retrying up to PDF_BUSY_RETRIES times with exponential
+    backoff from Retry-After while the server is busy; the last InferenceBusy
+    is raised.
+    """
+    for attempt in range(PDF_BUSY_RETRIES + 1):
+        try:
+            return await run(*args)
+        except InferenceBusy as e:
+            if attempt == PDF_BUSY_RETRIES:
+                raise
+            await asyncio.sleep(e.retry_after * 2 ** attempt)
+
+@router.post("/ocr-translate-pdf")
+async def ocr_translate_pdf(request: PDFRequest):
+    """
+    Text (from the text layer, OCR for scanned pages, or both) and
+    translation of every page of a base64 PDF, streamed as NDJSON: one line
+    per page in the order pages finish, then {"done": true, ...}. Pages that
+    stay busy after PDF_BUSY_RETRIES retries are reported with "busy": true.
+    """
+    if fitz is None:
+        raise HTTPException(status_code=503, detail="PyMuPDF not installed.")
+    if state.executor is None:
+        raise HTTPException(status_code=503, detail="Inference executor not running.")
+
+    try:
+        b64_data = request.pdf_base64.strip()
+        if b64_data.startswith("data:"):
+            b64_data = b64_data.split(",", 1)[1]
+        pdf = PDFDocument(base64.b64decode(b64_data, validate=True))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid PDF data: {e}")
+    if pdf.doc.needs_pass:
+        pdf.close()
+        raise HTTPException(status_code=400, detail="PDF is encrypted")
+    if len(pdf) > PDF_MAX_PAGES:
+        pdf.close()
+        raise HTTPException(status_code=400, detail=f"At most {PDF_MAX_PAGES} pages per PDF")
+
+    limit = asyncio.Semaphore(max(1, PDF_PAGE_CONCURRENCY))
+
+    async def run_page(number):
+        async with limit:
+            try:
+                result = await _retry_busy(state.executor.run, process_page, pdf, number, request.source_lang)
+            except InferenceBusy as e:
+                return {"page": number + 1, "error": str(e), "busy": True, "retry_after": e.retry_after}
+            except Exception as e:
+                traceback.print_exc()
+                return {"page": number + 1, "error": f"Page failed: {e}"}
+        result["translated_text"] = None
+        if request.translate and state.batcher is not None and result["extracted_text"]:
+            try:
+                result["translated_text"] = await _retry_busy(
+                    state.batcher.translate, result["extracted_text"], request.source_lang
+                )
+            except InferenceBusy as e:
+                result.update(translation_error=str(e), busy=True, retry_after=e.retry_after)
+            except Exception as e:
+                result["translation_error"] = str(e)
+        return result
+
+    async def body():
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(run_page(number)) for number in range(len(pdf))]
+        sources = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                source = result.get("source", "error")
+                sources[source] = sources.get(source, 0) + 1
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "done": True,
+                "pages": len(tasks),
+                "sources": sources,
+                "ms": round((time.perf_counter() - start) * 1000, 1),
+            }) + "\n"
+        finally:
+            # client gone: pages that haven't started never run
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            pdf.close()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@router.get("/ocr-cache/stats")
+async def ocr_cache_stats():
+    if state.ocr_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **state.ocr_cache.stats()}
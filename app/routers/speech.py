@@ -5,7 +5,6 @@ import tempfile
 from fastapi import APIRouter, UploadFile, File, HTTPException, Body
 import whisper
 import app.state as state
-from app.model import translate_with_model
 
 router = APIRouter(tags=["speech"])
 
@@ -40,7 +39,7 @@ def decode_base64_audio(b64_str: str) -> bytes:
 
 
 def whisper_transcribe(audio_bytes: bytes):
-    """Run Whisper on in-memory audio bytes."""
+    """Run Whisper on in-memory audio bytes (blocking; call via the executor)."""
     if state.whisper_model is None:
         raise HTTPException(503, "Whisper STT model not loaded.")
 
@@ -57,6 +56,15 @@ def whisper_transcribe(audio_bytes: bytes):
     return transcript, detected_lang
 
 
+async def transcribe_async(audio_bytes: bytes):
+    """Run whisper_transcribe on the bounded inference executor."""
+    if state.whisper_model is None:
+        raise HTTPException(503, "Whisper STT model not loaded.")
+    if state.executor is None:
+        raise HTTPException(503, "Inference executor not running.")
+    return await state.executor.run(whisper_transcribe, audio_bytes)
+
+
 # ------------------------------------------------------
 # 2) /speech-to-text
 # ------------------------------------------------------
@@ -82,7 +90,7 @@ async def speech_to_text(
         raise HTTPException(status_code=400, detail="Send 'file' or 'audio_base64'.")
 
     # STT
-    transcript, detected_lang = whisper_transcribe(audio_bytes)
+    transcript, detected_lang = await transcribe_async(audio_bytes)
 
     return {
         "transcript": transcript,
@@ -121,21 +129,17 @@ async def speech_translate(
         raise HTTPException(400, "Send 'file' or 'audio_base64'.")
 
     # 2) Run Whisper → transcript + detected language
-    transcript, detected_lang = whisper_transcribe(audio_bytes)
+    transcript, detected_lang = await transcribe_async(audio_bytes)
 
     # Whisper returns ISO language code (e.g., "ne", "si", "en")
     if detected_lang not in ["ne", "si", "en"]:
         detected_lang = "ne"  # fallback (your model default)
 
     # 3) Translate using your translation model
-    if state.model_bundle is None:
+    if state.model_bundle is None or state.batcher is None:
         raise HTTPException(503, "Translation model not loaded.")
 
-    translated_text = translate_with_model(
-        state.model_bundle,
-        transcript,
-        detected_lang
-    )
+    translated_text = await state.batcher.translate(transcript, detected_lang)
 
     return {
         "transcript": transcript,
@@ -1,23 +1,212 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import json
+import os
 import traceback
 import app.state as state
-from app.schemas import TranslateRequest, TranslateResponse
-from app.model import translate_with_model
+from app.schemas import (
+    BatchTranslateRequest,
+    BatchTranslateResponse,
+    MultiTranslateRequest,
+    MultiTranslateResponse,
+    TranslateRequest,
+    TranslateResponse,
+)
+from app.executor import InferenceBusy
+from app.langdetect import resolve_source_lang
+from app.model import TARGET_LANG, resolve_profile, resolve_target_lang, translate_multi_with_model
+from app.streaming import format_sse, stream_translation
 
 router = APIRouter()
 
+# Items accepted by one /translate-batch request
+TRANSLATE_BATCH_MAX_ITEMS = int(os.getenv("TRANSLATE_BATCH_MAX_ITEMS", "1000"))
+
 @router.post("/translate-text", response_model=TranslateResponse)
 async def translate_text(payload: TranslateRequest):
-    if state.model_bundle is None:
+    if state.model_bundle is None or state.batcher is None:
+        raise HTTPException(status_code=503, detail="Model not loaded.")
+
+    text = (payload.text or "").strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Empty text")
+
+    try:
+        profile = resolve_profile(payload.profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    source_lang, confidence = resolve_source_lang(text, payload.source_lang)
+    try:
+        translated = await state.batcher.translate(text, source_lang, profile)
+        return TranslateResponse(
+            translated_text=translated,
+            detected_source_lang=source_lang if confidence is not None else None,
+            source_lang_confidence=confidence,
+        )
+    except InferenceBusy:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Translation error: {e}")
+
+@router.post("/translate-multi", response_model=MultiTranslateResponse)
+async def translate_multi(payload: MultiTranslateRequest):
+    """Translate one text into several target languages with one encoder pass."""
+    if state.model_bundle is None or state.executor is None:
         raise HTTPException(status_code=503, detail="Model not loaded.")
 
     text = (payload.text or "").strip()
     if not text:
         raise HTTPException(status_code=400, detail="Empty text")
+    requested = list(dict.fromkeys(payload.target_langs))
+    if not requested:
+        raise HTTPException(status_code=400, detail="target_langs is empty")
+
+    try:
+        profile = resolve_profile(payload.profile)
+        targets = [resolve_target_lang(state.model_bundle, lang) for lang in requested]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    source_lang, confidence = resolve_source_lang(text, payload.source_lang)
     try:
-        translated = translate_with_model(state.model_bundle, text, payload.source_lang)
-        return TranslateResponse(translated_text=translated)
+        by_code = await state.executor.run(
+            translate_multi_with_model, state.model_bundle, text, source_lang, targets, profile
+        )
+        return MultiTranslateResponse(
+            translations={lang: by_code[code] for lang, code in zip(requested, targets)},
+            detected_source_lang=source_lang if confidence is not None else None,
+            source_lang_confidence=confidence,
+        )
+    except InferenceBusy:
+        raise
     except Exception as e:
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Translation error: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Translation error: {e}")
+
+@router.post("/translate-batch", response_model=BatchTranslateResponse)
+async def translate_batch(payload: BatchTranslateRequest):
+    """
+    Translate many {text, source_lang, target_lang} items in one request.
+    Identical items are translated once; all segments are batched together.
+    """
+    if state.model_bundle is None or state.batcher is None:
+        raise HTTPException(status_code=503, detail="Model not loaded.")
+    if len(payload.items) > TRANSLATE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {TRANSLATE_BATCH_MAX_ITEMS} items per batch")
+
+    try:
+        profile = resolve_profile(payload.profile)
+        keys = [
+            (
+                (item.text or "").strip(),
+                item.source_lang,
+                resolve_target_lang(state.model_bundle, item.target_lang) if item.target_lang else TARGET_LANG,
+            )
+            for item in payload.items
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    unique = list(dict.fromkeys(keys))
+    try:
+        outputs = await state.batcher.translate_many(unique, profile)
+    except InferenceBusy:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Translation error: {e}")
+
+    by_key = dict(zip(unique, outputs))
+    return BatchTranslateResponse(translations=[by_key[key] for key in keys])
+
+async def _guarded_events(events, first):
+    """Yield `first` and the rest of `events`, turning failures into an error event."""
+    yield first
+    try:
+        async for event in events:
+            yield event
+    except InferenceBusy as e:
+        yield {"event": "error", "detail": str(e), "retry_after": e.retry_after}
+    except Exception as e:
+        traceback.print_exc()
+        yield {"event": "error", "detail": f"Translation error: {e}"}
+
+@router.post("/translate-text/stream")
+async def translate_text_stream(payload: TranslateRequest):
+    """
+    Server-Sent Events: `token` events carry text deltas as they are decoded
+    (greedy), a final `done` event carries the full translation.
+    """
+    if state.model_bundle is None or state.executor is None:
+        raise HTTPException(status_code=503, detail="Model not loaded.")
+
+    text = (payload.text or "").strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Empty text")
+
+    events = stream_translation(text, payload.source_lang)
+    # Start the first segment before answering, so a full queue is still a plain 503
+    try:
+        first = await events.__anext__()
+    except InferenceBusy:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Translation error: {e}")
+
+    async def body():
+        async for event in _guarded_events(events, first):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/translate-text/ws")
+async def translate_text_ws(websocket: WebSocket):
+    """
+    WebSocket variant: send {"text": ..., "source_lang": ...} messages and
+    receive the same token / done / error events as JSON.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"event": "error", "detail": "Message is not valid JSON"})
+                continue
+            if not isinstance(message, dict) or not isinstance(message.get("text") or "", str):
+                await websocket.send_json({"event": "error", "detail": 'Expected {"text": "...", "source_lang": ...}'})
+                continue
+            text = (message.get("text") or "").strip()
+            if state.model_bundle is None or state.executor is None:
+                await websocket.send_json({"event": "error", "detail": "Model not loaded."})
+                continue
+            if not text:
+                await websocket.send_json({"event": "error", "detail": "Empty text"})
+                continue
+            events = stream_translation(text, message.get("source_lang"))
+            try:
+                first = await events.__anext__()
+            except InferenceBusy as e:
+                await websocket.send_json({"event": "error", "detail": str(e), "retry_after": e.retry_after})
+                continue
+            except Exception as e:
+                traceback.print_exc()
+                await websocket.send_json({"event": "error", "detail": f"Translation error: {e}"})
+                continue
+            async for event in _guarded_events(events, first):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+
+@router.get("/translate-cache/stats")
+async def translate_cache_stats():
+    if state.translation_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **state.translation_cache.stats()}
@@ -1,20 +1,80 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
 
 class TranslateRequest(BaseModel):
     text: str
     source_lang: Optional[str] = None
+    profile: Optional[str] = None  # "fast" | "balanced" | "quality" (default)
 
 class TranslateResponse(BaseModel):
     translated_text: str
+    detected_source_lang: Optional[str] = None  # set when source_lang was detected
+    source_lang_confidence: Optional[float] = None
+
+class MultiTranslateRequest(BaseModel):
+    text: str
+    source_lang: Optional[str] = None
+    target_langs: List[str]  # friendly ("en") or NLLB ("fra_Latn") codes
+    profile: Optional[str] = None
+
+class MultiTranslateResponse(BaseModel):
+    translations: Dict[str, str]  # keyed by the requested target code
+    detected_source_lang: Optional[str] = None
+    source_lang_confidence: Optional[float] = None
+
+class BatchTranslateItem(BaseModel):
+    text: str
+    source_lang: Optional[str] = None
+    target_lang: Optional[str] = None  # friendly or NLLB code; English by default
+
+class BatchTranslateRequest(BaseModel):
+    items: List[BatchTranslateItem]
+    profile: Optional[str] = None
+
+class BatchTranslateResponse(BaseModel):
+    translations: List[str]  # same order as items
+
+class JobCreateRequest(BaseModel):
+    text: Optional[str] = None
+    pages: Optional[List[str]] = None  # multi-page input, translated page by page
+    source_lang: Optional[str] = None
+    target_lang: Optional[str] = None
+    profile: Optional[str] = None
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str  # "queued" | "running" | "done" | "failed" | "cancelled"
+    total_segments: int
+    done_segments: int
+    progress: float
+    error: Optional[str] = None
+    partial_results: Optional[List[str]] = None  # per page, translated so far
 
 class OCRRequest(BaseModel):
     image_base64: str
     source_lang: Optional[str] = "ne"
 
+class PDFRequest(BaseModel):
+    pdf_base64: str
+    source_lang: Optional[str] = None  # detected per page when missing
+    translate: bool = True
+
+class OCRAttemptReport(BaseModel):
+    lang: str
+    psm: str
+    variant: str  # "processed" | "original" image
+    confidence: float  # mean word confidence, 0-100
+    words: int
+    ms: float
+    error: Optional[str] = None
+
 class OCRResponse(BaseModel):
     detected_script: str
     detected_language: str
     extracted_text: str
     translated_text: Optional[str] = None
+    language_confidence: Optional[float] = None  # share of letters in the detected script
+    ocr_confidence: Optional[float] = None  # mean word confidence of the chosen attempt
+    ocr_attempts: List[OCRAttemptReport] = []
+    cached: bool = False  # served from the OCR result cache
 
@@ -0,0 +1,105 @@
+# app/segment.py
+"""
+Sentence segmentation for long inputs.
+
+Texts are split on Devanagari danda / double danda, Sinhala kunddaliya,
+Latin (and modern Sinhala) sentence punctuation and blank lines, so each
+segment fits comfortably in the model's generation budget. Single line
+breaks (hard-wrapped OCR / PDF lines) stay inside a sentence, and a period
+after a known abbreviation or an initial doesn't end one. The whitespace
+between segments is kept so translations can be reassembled in order.
+"""
+import re
+from typing import List, Tuple
+
+# Segments longer than this are hard-wrapped at whitespace
+MAX_SEGMENT_CHARS = 300
+
+# End of a sentence: ". ! ?" (plus closing quotes/brackets) before whitespace,
+# any danda / double danda / kunddaliya, or a blank line.
+_BOUNDARY = re.compile(r"[.!?]+[\"'”’)\]]*(?=\s)|[।॥෴]+[\"'”’)\]]*|\n[ \t]*\n\s*")
+
+# Words whose trailing period is not a sentence end (lowercase, without the final ".")
+_ABBREVIATIONS = {
+    "dr", "mr", "mrs", "ms", "prof", "st", "jr", "sr", "vs", "etc", "fig", "vol",
+    "e.g", "i.e", "approx", "dept", "govt", "ltd", "pvt", "inc", "co",
+    "डा", "प्रा", "नं", "श्री",
+}
+
+
+def _is_abbreviation(text: str, match: "re.Match") -> bool:
+    """True for a single "." ending an abbreviation or an initial ("Dr.", "e.g.", "J.")."""
+    if match.group() != ".":
+        return False
+    # only the word right before the period matters
+    before = re.search(r"\S+$", text[max(0, match.start() - 32):match.start()])
+    if before is None:
+        return False
+    word = before.group().lstrip("\"'“‘([").lower()
+    return word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+
+def _wrap(segment: str, max_chars: int) -> List[str]:
+    """Hard-wrap an over-long segment at whitespace, cutting words longer than max_chars."""
+    if len(segment) <= max_chars:
+        return [segment]
+    words = []
+    for word in segment.split():
+        # e.g. long URLs or text without spaces
+        words.extend(word[i:i + max_chars] for i in range(0, len(word), max_chars))
+    parts, current = [], ""
+    for word in words:
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_sentences(text: str, max_chars: int = MAX_SEGMENT_CHARS) -> Tuple[List[str], List[str]]:
+    """
+    Split `text` into sentence segments.
+    Returns (segments, separators) where len(separators) == len(segments) + 1
+    and text ~= separators[0] + segments[0] + separators[1] + ... + separators[-1].
+    """
+    chunks, pos = [], 0
+    for m in _BOUNDARY.finditer(text):
+        if _is_abbreviation(text, m):
+            continue
+        chunks.append(text[pos:m.end()])
+        pos = m.end()
+    chunks.append(text[pos:])
+
+    segments: List[str] = []
+    separators: List[str] = [""]
+    for chunk in chunks:
+        body = chunk.strip()
+        if not body:
+            separators[-1] += chunk
+            continue
+        lead = chunk[: len(chunk) - len(chunk.lstrip())]
+        trail = chunk[len(chunk.rstrip()):]
+        separators[-1] += lead
+        # a line break inside a paragraph is just a space for the model
+        body = re.sub(r"[ \t]*\n[ \t]*", " ", body)
+        wrapped = _wrap(body, max_chars)
+        for i, part in enumerate(wrapped):
+            segments.append(part)
+            separators.append(trail if i == len(wrapped) - 1 else " ")
+    return segments, separators
+
+
+def join_sentences(translations: List[str], separators: List[str]) -> str:
+    """Reassemble translated segments with the original separators."""
+    out = [separators[0]]
+    for i, translated in enumerate(translations):
+        out.append(translated)
+        sep = separators[i + 1]
+        if not sep and i + 1 < len(translations):
+            # e.g. "...छ।तिमी" - keep target sentences apart
+            sep = " "
+        out.append(sep)
+    return "".join(out).strip()
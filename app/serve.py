@@ -0,0 +1,244 @@
+# app/serve.py
+"""
+Pre-fork server: load the models once, then fork uvicorn workers that
+share the weights instead of each loading their own copy.
+
+    python -m app.serve --workers 4 --port 8000 [--threads-per-worker 2] [--report-memory]
+
+The parent loads the NLLB model (and Whisper, if the speech router loads
+it), moves the tensors into shared memory, freezes the GC so refcount
+bookkeeping doesn't dirty the heap, and forks. Each worker runs its own
+event loop, batcher, executor and caches on the inherited listening
+socket. Send SIGUSR1 to the parent to print per-worker memory.
+
+CUDA contexts don't survive fork, so the models are pinned to the CPU
+(CUDA_VISIBLE_DEVICES is cleared before torch is loaded) and the parent
+refuses to fork if CUDA was initialized anyway. A model whose tensors can't
+be moved into shared memory is left where it is and shared copy-on-write.
+Crashed workers are restarted with exponential backoff; after
+--max-restarts restarts within RESTART_WINDOW seconds the server gives up.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, Optional
+
+import app.state as state
+
+# Restarts counted against --max-restarts; a worker that stays up this long
+# also resets the backoff
+RESTART_WINDOW = 60.0
+RESTART_MIN_DELAY = 0.5
+RESTART_MAX_DELAY = 30.0
+
+
+# ------------------------------------------------------
+# Shared weights
+# ------------------------------------------------------
+def share_module(module) -> None:
+    """Freeze a torch module and move its tensors into shared memory."""
+    module.eval()
+    for param in module.parameters():
+        param.requires_grad_(False)
+    # MAP_SHARED pages are never copied on write after fork
+    module.share_memory()
+
+
+def share_model_weights() -> None:
+    bundle = state.model_bundle
+    models = []
+    if bundle is not None and bundle.get("backend", "torch") == "torch":
+        models.append(("Translation model", bundle["model"]))
+    if state.whisper_model is not None:
+        models.append(("Whisper", state.whisper_model))
+    for name, module in models:
+        try:
+            share_module(module)
+            print(f"{name} weights moved to shared memory")
+        except Exception as e:
+            # e.g. quantized modules or mmapped safetensors; fork still shares the pages
+            print(f"[WARN] {name} weights not moved to shared memory ({e}); sharing copy-on-write", file=sys.stderr)
+
+
+# ------------------------------------------------------
+# Memory measurement
+# ------------------------------------------------------
+def memory_usage(pid: int) -> Dict[str, float]:
+    """
+    RSS / PSS / shared / private memory of a process in MB (Linux).
+    PSS splits shared pages between the processes mapping them, so the sum
+    of PSS over all workers is their real footprint.
+    """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "shared": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+        "private": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def report_memory(parent_pid: int, worker_pids) -> None:
+    print(f"{'process':<16} {'RSS MB':>9} {'PSS MB':>9} {'shared MB':>10} {'private MB':>11}")
+    total_pss = 0.0
+    for label, pid in [("parent", parent_pid)] + [(f"worker {pid}", pid) for pid in worker_pids]:
+        try:
+            m = memory_usage(pid)
+        except OSError as e:
+            print(f"{label:<16} unavailable: {e}")
+            continue
+        total_pss += m["pss"]
+        print(f"{label:<16} {m['rss']:>9.1f} {m['pss']:>9.1f} {m['shared']:>10.1f} {m['private']:>11.1f}")
+    n = max(1, len(worker_pids))
+    print(f"total PSS {total_pss:.1f} MB, {total_pss / n:.1f} MB effective per worker")
+
+
+# ------------------------------------------------------
+# Workers
+# ------------------------------------------------------
+def _run_worker(sock: socket.socket, args) -> None:
+    import torch
+    import uvicorn
+
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+        signal.signal(sig, signal.SIG_DFL)
+    if args.threads_per_worker:
+        torch.set_num_threads(args.threads_per_worker)
+
+    config = uvicorn.Config("app.main:app", log_level=args.log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(sock, args)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="torch intra-op threads (0 = torch default)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--report-memory", action="store_true", help="print per-worker memory once workers are up")
+    parser.add_argument(
+        "--max-restarts", type=int, default=10, help=f"worker restarts allowed within {RESTART_WINDOW:.0f}s before giving up"
+    )
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, "fork"):
+        sys.exit("Pre-fork serving needs os.fork(); use `uvicorn app.main:app --workers N` instead.")
+
+    # Forked children can't use the parent's CUDA context: load on the CPU
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+    # Importing the app loads Whisper (speech router) in the parent
+    import app.main  # noqa: F401
+    import torch
+    from app.model import load_model
+
+    try:
+        state.model_bundle = load_model()
+    except Exception:
+        print("Failed to load translation model in parent; workers will retry:", file=sys.stderr)
+        traceback.print_exc()
+        state.model_bundle = None
+    if torch.cuda.is_initialized():
+        sys.exit("CUDA was initialized before fork; run `uvicorn app.main:app --workers N` on GPU hosts.")
+    share_model_weights()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Keep the GC from touching (and so copying) every inherited object
+    gc.collect()
+    gc.freeze()
+
+    workers: Dict[int, float] = {}  # pid -> start time
+    for _ in range(max(1, args.workers)):
+        workers[_spawn(sock, args)] = time.monotonic()
+    print(f"Serving on {args.host}:{args.port} with {len(workers)} workers (parent pid {os.getpid()})")
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: report_memory(os.getpid(), sorted(workers)))
+
+    if args.report_memory:
+        time.sleep(5)  # let workers finish startup
+        report_memory(os.getpid(), sorted(workers))
+
+    restarts = []  # monotonic times of recent restarts
+    delay = RESTART_MIN_DELAY
+    gave_up = False
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if stopping:
+            continue
+        now = time.monotonic()
+        restarts = [t for t in restarts if now - t < RESTART_WINDOW]
+        if len(restarts) >= args.max_restarts:
+            print(
+                f"Worker {pid} exited with status {status}; {len(restarts)} restarts in "
+                f"{RESTART_WINDOW:.0f}s, giving up",
+                file=sys.stderr,
+            )
+            gave_up = True
+            _stop(signal.SIGTERM, None)
+            continue
+        if started is not None and now - started >= RESTART_WINDOW:
+            delay = RESTART_MIN_DELAY
+        print(f"Worker {pid} exited with status {status}; restarting in {delay:.1f}s", file=sys.stderr)
+        time.sleep(delay)
+        delay = min(RESTART_MAX_DELAY, delay * 2)
+        if stopping:
+            continue
+        restarts.append(time.monotonic())
+        workers[_spawn(sock, args)] = time.monotonic()
+    sock.close()
+    if gave_up:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
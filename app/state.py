@@ -3,5 +3,11 @@ from typing import Optional
 # Shared state for the FastAPI app
 model_bundle: Optional[dict] = None
 whisper_model = None  # Add this line for speech router
+batcher = None  # TranslationBatcher created at startup once the model is loaded
+executor = None  # InferenceExecutor for blocking OCR / speech work
+translation_cache = None  # TieredCache of segment translations (None when disabled)
+ocr_cache = None  # TieredCache of OCR results keyed by image hash (None when disabled)
+job_store = None  # JobStore of asynchronous translation jobs (None when disabled)
+job_worker = None  # JobWorker processing them in this process
 
 # Note: No longer storing ocr_reader since we use pytesseract directly
@@ -0,0 +1,128 @@
+# app/streaming.py
+"""
+Token streaming for /translate-text/stream (SSE) and /translate-text/ws.
+
+Each sentence segment is decoded greedily on the inference executor with a
+streamer that pushes partial target text onto an asyncio queue as soon as
+tokens are generated, so the first words reach the client long before the
+whole translation is finished.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from transformers import TextStreamer
+
+import app.state as state
+from app.cache import translation_cache_key
+from app.model import (
+    DEFAULT_SOURCE_LANG,
+    LANG_MAP,
+    TARGET_LANG,
+    encode_text,
+    generation_settings,
+    plan_segments,
+    translate_ids_batch,
+)
+from app.segment import join_sentences
+
+# Beam search can't emit partial hypotheses, so streaming always decodes greedily
+STREAM_PROFILE = "fast"
+
+_END = object()
+
+
+class StreamCancelled(Exception):
+    """Raised inside generate() to stop decoding once the client has gone."""
+
+
+class AsyncTextStreamer(TextStreamer):
+    """
+    TextStreamer that hands decoded text to an asyncio queue on `loop`.
+    Model ids are mapped back to tokenizer ids for trimmed vocabularies.
+    """
+
+    def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, vocab_map=None):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True, clean_up_tokenization_spaces=True)
+        self.loop = loop
+        self.vocab_map = vocab_map
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = False
+
+    def put(self, value):
+        if self.cancelled:
+            raise StreamCancelled()
+        if self.vocab_map is not None:
+            value = self.vocab_map.to_tokenizer(value)
+        super().put(value)
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+
+
+def _translate_segment(bundle: Dict[str, Any], segment: str, source_lang: Optional[str], streamer) -> List[str]:
+    """Blocking, on the inference executor: tokenize one segment and decode it into `streamer`."""
+    return translate_ids_batch(bundle, [encode_text(bundle, segment, source_lang)], STREAM_PROFILE, streamer=streamer)
+
+
+async def stream_translation(text: str, source_lang: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield {"event": "token", "segment": i, "text": ...} deltas whose
+    concatenation is the translation, then {"event": "done", "translated_text": ...}.
+    Raises InferenceBusy if the executor is full when a segment starts.
+    """
+    bundle = state.model_bundle
+    cache = state.translation_cache
+    loop = asyncio.get_running_loop()
+    settings = generation_settings(bundle, STREAM_PROFILE)
+    # segmentation, detection and tokenization stay off the event loop
+    segments, separators, source_lang, (fixed,) = await asyncio.to_thread(
+        plan_segments, text, source_lang, [TARGET_LANG]
+    )
+    src = LANG_MAP.get(source_lang, DEFAULT_SOURCE_LANG)
+    translations = []
+    for i, segment in enumerate(segments):
+        if i > 0:
+            # same spacing join_sentences puts between segments
+            yield {"event": "token", "segment": i, "text": separators[i] or " "}
+
+        if fixed[i] is not None:
+            translations.append(fixed[i])
+            yield {"event": "token", "segment": i, "text": fixed[i]}
+            continue
+
+        cache_key = translation_cache_key(segment, src, TARGET_LANG, settings) if cache is not None else None
+        # the disk tier may be read: keep it off the event loop
+        cached = await asyncio.to_thread(cache.get, cache_key) if cache_key is not None else None
+        if cached is not None:
+            translations.append(cached)
+            yield {"event": "token", "segment": i, "text": cached}
+            continue
+
+        streamer = AsyncTextStreamer(bundle["tokenizer"], loop, bundle.get("vocab_map"))
+        future = state.executor.submit(_translate_segment, bundle, segment, source_lang, streamer)
+        # queued after the streamer's last text, so it always arrives last
+        future.add_done_callback(lambda _f, q=streamer.queue: loop.call_soon_threadsafe(q.put_nowait, _END))
+        try:
+            while True:
+                chunk = await streamer.queue.get()
+                if chunk is _END:
+                    break
+                yield {"event": "token", "segment": i, "text": chunk}
+        finally:
+            if not future.done():
+                # client went away mid-segment: stop decoding at the next token
+                streamer.cancelled = True
+
+        output = future.result()[0]
+        translations.append(output)
+        if cache_key is not None:
+            await asyncio.to_thread(cache.set, cache_key, output)
+
+    yield {"event": "done", "translated_text": join_sentences(translations, separators) if segments else ""}
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    payload = {k: v for k, v in event.items() if k != "event"}
+    return f"event: {event['event']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
@@ -0,0 +1,144 @@
+# app/trim_vocab.py
+"""
+Trim the NLLB vocabulary to the languages this service actually serves.
+
+    python -m app.trim_vocab --corpus ne.txt si.txt en.txt --langs ne si en --out models/nllb-trimmed
+
+Keeps only tokens seen when tokenizing the corpus files (one sentence per
+line, covering both source and target languages), plus ids 0..3
+(<s>, <pad>, </s>, <unk>) and the language tags of --langs. Every other
+special token is dropped, including <mask> and the tags of languages not in
+--langs: those targets become unavailable in the trimmed model and
+resolve_target_lang rejects them. The embedding matrix and the output
+projection are sliced to the kept rows and saved with a `vocab_map.json`
+that maps original tokenizer ids to model ids. Load the result with
+NLLB_TRIMMED_DIR=models/nllb-trimmed; the original tokenizer keeps working
+through VocabMap.
+"""
+import argparse
+import json
+import os
+from typing import Iterable, List, Sequence
+
+import torch
+
+VOCAB_MAP_FILE = "vocab_map.json"
+
+
+class VocabMap:
+    """
+    Maps original tokenizer ids <-> trimmed model ids. Tokens that were
+    trimmed away map to the model's <unk>.
+    """
+
+    def __init__(self, kept_ids: Sequence[int], full_vocab_size: int, unk_id: int):
+        self.kept_ids = list(kept_ids)
+        self.full_vocab_size = full_vocab_size
+        self.unk_id = unk_id
+        self.new_to_old = torch.tensor(self.kept_ids, dtype=torch.long)
+        self.old_to_new = torch.full((full_vocab_size,), self.kept_ids.index(unk_id), dtype=torch.long)
+        self.old_to_new[self.new_to_old] = torch.arange(len(self.kept_ids), dtype=torch.long)
+        self.unk_model_id = int(self.old_to_new[unk_id])
+
+    def __len__(self) -> int:
+        return len(self.kept_ids)
+
+    def to_model(self, ids: List[int]) -> List[int]:
+        return self.old_to_new[torch.tensor(ids, dtype=torch.long)].tolist()
+
+    def model_id(self, tokenizer_id: int):
+        """Model id of one tokenizer id, or None if it was trimmed away."""
+        new_id = int(self.old_to_new[tokenizer_id])
+        return new_id if self.kept_ids[new_id] == tokenizer_id else None
+
+    def to_tokenizer(self, ids: torch.Tensor) -> torch.Tensor:
+        return self.new_to_old.to(ids.device)[ids]
+
+    def save(self, directory: str) -> None:
+        with open(os.path.join(directory, VOCAB_MAP_FILE), "w") as f:
+            json.dump({"full_vocab_size": self.full_vocab_size, "unk_id": self.unk_id, "kept_ids": self.kept_ids}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "VocabMap":
+        with open(os.path.join(directory, VOCAB_MAP_FILE)) as f:
+            data = json.load(f)
+        return cls(data["kept_ids"], data["full_vocab_size"], data["unk_id"])
+
+
+def collect_token_ids(tokenizer, lines: Iterable[str]) -> set:
+    ids = set()
+    batch = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            batch.append(line)
+        if len(batch) >= 1024:
+            for row in tokenizer(batch, add_special_tokens=False)["input_ids"]:
+                ids.update(row)
+            batch = []
+    if batch:
+        for row in tokenizer(batch, add_special_tokens=False)["input_ids"]:
+            ids.update(row)
+    return ids
+
+
+def trim_model(model, kept_ids: List[int]) -> None:
+    """Slice the shared embeddings and lm_head of an NLLB model in place."""
+    index = torch.tensor(kept_ids, dtype=torch.long)
+    shared = model.get_input_embeddings()
+    weight = torch.nn.Parameter(shared.weight.data[index].clone())
+
+    embeddings = {id(shared): shared}
+    for module in (model.model.encoder.embed_tokens, model.model.decoder.embed_tokens):
+        embeddings[id(module)] = module
+    for module in embeddings.values():
+        module.weight = weight
+        module.num_embeddings = len(kept_ids)
+
+    lm_head = torch.nn.Linear(weight.shape[1], len(kept_ids), bias=False)
+    lm_head.weight = weight
+    model.lm_head = lm_head
+    model.config.vocab_size = len(kept_ids)
+
+
+def main() -> None:
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    from app.model import LANG_MAP, MODEL_NAME, build_lang_id_table
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", nargs="+", required=True, help="text files, one sentence per line")
+    parser.add_argument("--langs", nargs="+", default=list(LANG_MAP), help="friendly or NLLB codes to keep")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+    lang_ids = build_lang_id_table(tokenizer)
+
+    # <s> <pad> </s> <unk> (ids 0..3); other language tags are trimmed unless listed
+    kept = set(range(4))
+    kept.update(tokenizer.convert_tokens_to_ids([tokenizer.bos_token, tokenizer.pad_token, tokenizer.eos_token, tokenizer.unk_token]))
+    for lang in args.langs:
+        code = LANG_MAP.get(lang, lang)
+        if code not in lang_ids:
+            raise SystemExit(f"Unknown language {lang!r}")
+        kept.add(lang_ids[code])
+    for path in args.corpus:
+        with open(path, encoding="utf-8") as f:
+            kept.update(collect_token_ids(tokenizer, f))
+    # ascending order keeps the special ids (0..3) where the config expects them
+    kept_ids = sorted(kept)
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+    full_size = model.get_input_embeddings().weight.shape[0]
+    trim_model(model, kept_ids)
+
+    os.makedirs(args.out, exist_ok=True)
+    model.save_pretrained(args.out)
+    tokenizer.save_pretrained(args.out)
+    VocabMap(kept_ids, full_size, tokenizer.unk_token_id).save(args.out)
+    print(f"Kept {len(kept_ids)} of {full_size} tokens ({len(kept_ids) / full_size:.1%}); saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()